@@ -8,7 +8,14 @@ Diamond Light Source Ltd
 2022
 """
 
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import google_drive_api.api_functions as api
+from google_drive_api.archive import EXPORT_FORMATS, create_archive
+from google_drive_api.doc_builder import DocumentBuilder
+from google_drive_api.scheduler import OperationScheduler, RateLimiter, INTERACTIVE, IMAGES, BULK
 
 
 class GoogleDriveApi:
@@ -18,44 +25,153 @@ class GoogleDriveApi:
         from google_drive_api import GoogleDriveApi
         gdrive = GoogleDriveApi('credentials.json')
 
+    Sign-in happens when the API is first used, not when the class is created.
+    Services share a thread-safe pool of connections, so a GoogleDriveApi can be used from
+    multiple threads. Use pool_size=None for the default (not thread-safe) httplib2 transport.
+    Use trace_file='trace.jsonl.gz' to record every request, see google_drive_api.trace.
+
     doc = gdrive.get_file('file_id')
-    [docs] = gdrive.find_file('filename')
+    [docs] = gdrive.find_files('filename')
+    for file in gdrive.iter_files(folder_id='folder_id', page_size=50): print(file['name'])
     'link' = gdrive.get_link('file_id')
     gdrive.change_permission('file_id', can_edit=False)
+    gdrive.share(['file_id'], ['user@email.com'], role='writer')
     gdrive.upload('/path/to/file')
     doc = gdrive.copy_file('id_to_copy', 'new_name')
     gdrive.merge_template('file_id', {'{{replace_me}}': 'with me'})
+    gdrive.bulk_merge(['file_id1', 'file_id2'], {'{{replace_me}}': 'with me'})
     gdrive.append_text('file_id', 'text to append')
+    gdrive.append_text_stream('file_id', 'long/scan/log.txt')
     gdrive.append_image('file_id', 'loc/of/image.png')
+    gdrive.append_text_async('file_id', 'beam lost').result()  # won't wait behind image uploads
+    gdrive.new_entry('file_id').heading('title').paragraph('text').write()
     """
-    creds = None
-    drive_service = None
-    docs_service = None
-
-    def __init__(self, credentials_file='credentials.json', token_file='token.json'):
-        self.creds = api.signin(credentials_file, token_file)
-        self.drive_serivce, self.docs_service = api.build_services(self.creds)
+    _creds = None
+    _drive_service = None
+    _docs_service = None
+    _scheduler = None
+
+    def __init__(self, credentials_file='credentials.json', token_file='token.json', pool_size=10, timeout=60,
+                 trace_file=None):
+        self.credentials_file = credentials_file
+        self.token_file = token_file
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.trace_file = trace_file
+        self._lock = threading.Lock()
+
+    def _signin(self):
+        """Sign in and build services, if not already done"""
+        with self._lock:
+            if self._docs_service is None:
+                creds = api.signin(self.credentials_file, self.token_file)
+                self._drive_service, self._docs_service = api.build_services(
+                    creds, self.pool_size, self.timeout, self.trace_file)
+                self._creds = creds
+
+    @property
+    def creds(self):
+        if self._creds is None:
+            self._signin()
+        return self._creds
+
+    @property
+    def drive_service(self):
+        if self._drive_service is None:
+            self._signin()
+        return self._drive_service
+
+    @property
+    def docs_service(self):
+        if self._docs_service is None:
+            self._signin()
+        return self._docs_service
+
+    @property
+    def scheduler(self):
+        """OperationScheduler used by the *_async methods"""
+        with self._lock:
+            if self._scheduler is None:
+                self._scheduler = OperationScheduler()
+        return self._scheduler
 
     def get_file(self, file_id):
+        """
+        Return GoogleDriveFile, metadata is requested when first required
+        :param file_id: str FileID or dict with field 'id'
+        :return: GoogleDriveFile
+        """
         return GoogleDriveFile(file_id, self)
 
-    def find_files(self, filename):
+    def get_files(self, file_ids, hydrate=False):
+        """
+        Return list of GoogleDriveFiles
+        :param file_ids: list of str FileIDs
+        :param hydrate: bool, if True, request metadata for all files in batches
+        :return: [list of GoogleDriveFiles]
+        """
+        files = [self.get_file(file_id) for file_id in file_ids]
+        if hydrate:
+            self.hydrate(files)
+        return files
+
+    def hydrate(self, files):
+        """
+        Request metadata for GoogleDriveFiles that haven't been loaded, using batch requests
+        :param files: list of GoogleDriveFiles
+        :return: files
+        """
+        unloaded = {}
+        for file in files:
+            if not file.is_loaded:
+                unloaded.setdefault(file.id, []).append(file)
+        file_dicts = api.get_drive_file_dicts(list(unloaded), drive_service=self.drive_service)
+        for file_id, file_dict in zip(unloaded, file_dicts):
+            if file_dict is None:
+                continue
+            for file in unloaded[file_id]:
+                file._set_file_dict(file_dict)
+        return files
+
+    def iter_files(self, name=None, folder_id=None, mime_type=None, trashed=False, name_contains=None,
+                   query=None, fields='id, name, webContentLink, webViewLink', page_size=100, max_results=None,
+                   drive_id=None):
+        """
+        Generator of files in Google Drive matching a search, pages are requested as required
+        :param name: None or str exact file name
+        :param folder_id: None or str id of parent folder
+        :param mime_type: None or str mimeType, e.g. 'application/vnd.google-apps.document'
+        :param trashed: None or bool, if None, trashed files are included
+        :param name_contains: None or str part of file name
+        :param query: None or str additional query terms
+        :param fields: str file fields to return, e.g. 'id, name'
+        :param page_size: int number of files per request (max 1000)
+        :param max_results: None or int maximum number of files to return
+        :param drive_id: None or str id of Shared Drive, if given only this drive is searched
+        :return: generator of file dicts
+        """
+        return api.iter_files(name, folder_id, mime_type, trashed, name_contains, query,
+                              fields, page_size, max_results, drive_id, drive_service=self.drive_service)
+
+    def find_files(self, filename, folder_id=None, max_results=None):
         """
         Find files in Google Drive
         :param filename: str name of file
+        :param folder_id: None or str id of parent folder
+        :param max_results: None or int maximum number of files to return
         :return: [list of GoogleDriveFiles]
         """
-        files = api.find_filename(filename, self.drive_service)
+        files = self.iter_files(filename, folder_id, max_results=max_results)
         return [self.get_file(file) for file in files]
 
-    def is_file(self, filename):
+    def is_file(self, filename, folder_id=None):
         """
-        Return if file exists already
+        Return if file exists already, stops at the first match
         :param filename: str name of file
+        :param folder_id: None or str id of parent folder
         :return: True/False
         """
-        files = api.find_filename(filename, self.drive_service)
-        if files:
+        for _ in self.iter_files(filename, folder_id, fields='id', page_size=1, max_results=1):
             return True
         return False
 
@@ -74,7 +190,23 @@ class GoogleDriveApi:
         :param fields: str, list of metadata fields, e.g. 'id, name, webContentLink, webViewLink'
         :return: dict
         """
-        return api.get_drive_file_metadata(file_id, fields)
+        return api.get_drive_file_metadata(file_id, fields, self.drive_service)
+
+    def get_document_text(self, doc_id):
+        """
+        Get the plain text of a GoogleDoc
+        :param doc_id: str GoogleDoc id
+        :return: dict with fields 'documentId', 'title', 'revisionId', 'text'
+        """
+        return api.get_document_text(doc_id, self.docs_service)
+
+    def get_document_stats(self, doc_id):
+        """
+        Get the size of a GoogleDoc
+        :param doc_id: str GoogleDoc id
+        :return: dict with fields 'end_index', 'n_images'
+        """
+        return api.get_document_stats(doc_id, self.docs_service)
 
     def change_permission(self, file_id, can_edit=False):
         """
@@ -84,6 +216,26 @@ class GoogleDriveApi:
         """
         api.change_permission(file_id, can_edit, self.drive_service)
 
+    def share(self, file_ids, emails, role='writer', send_notification=False):
+        """
+        Give users permission to view or edit files, using batch requests
+        :param file_ids: list of str FileIDs
+        :param emails: list of str user email addresses
+        :param role: str 'reader', 'commenter' or 'writer'
+        :param send_notification: bool, if True, users are sent a notification email
+        :return: int number of permissions created
+        """
+        return api.share_files(file_ids, emails, role, send_notification, self.drive_service)
+
+    def revoke(self, file_ids, emails):
+        """
+        Remove user permissions from files, using batch requests
+        :param file_ids: list of str FileIDs
+        :param emails: list of str user email addresses
+        :return: int number of permissions removed
+        """
+        return api.revoke_files(file_ids, emails, self.drive_service)
+
     def upload_file(self, filename, folder_id=None):
         """
         Upload a local file to Google Drive. If the file exists already, return the previous file link
@@ -100,23 +252,89 @@ class GoogleDriveApi:
         """
         api.download_pdf(file_id, local_filename, self.drive_service)
 
-    def copy_file(self, id_to_copy, new_file_name):
+    def archive(self, doc_ids, archive_file, formats=tuple(EXPORT_FORMATS), include_images=True, max_workers=4,
+                chunksize=api.DOWNLOAD_CHUNK_SIZE):
+        """
+        Export GoogleDocs in several formats, with their images, into a single tar or zip archive
+        :param doc_ids: list of str GoogleDoc ids
+        :param archive_file: str archive filename, e.g. 'archive.tar.gz' or 'archive.zip'
+        :param formats: list of export formats, from 'pdf', 'docx', 'html', 'txt'
+        :param include_images: bool, if True, images in the documents are added
+        :param max_workers: int maximum number of concurrent downloads
+        :param chunksize: int bytes per download request
+        :return: dict manifest, manifest['failures'] lists any exports or images that could not be downloaded
+        """
+        return create_archive(self, doc_ids, archive_file, formats, include_images, max_workers, chunksize)
+
+    def copy_file(self, id_to_copy, new_file_name, folder_id=None, app_properties=None):
         """
         Copy a file in Google Drive to a new file, return the new ID
         :param id_to_copy: str, FileID
         :param new_file_name: str, new file name
+        :param folder_id: None or id of folder to put the copy in
+        :param app_properties: None or dict of private application properties {'key': 'value'}
         :return GoogleDriveFile of copied file
         """
-        copiedfile_id = api.copy_file(id_to_copy, new_file_name, self.drive_service)
+        copiedfile_id = api.copy_file(id_to_copy, new_file_name, self.drive_service,
+                                      folder_id=folder_id, app_properties=app_properties)
         return self.get_file(copiedfile_id)
 
+    def update_file(self, file_id, name=None, add_parents=None, remove_parents=None, app_properties=None):
+        """
+        Update the name, folder or application properties of a file
+        :param file_id: str, FileID
+        :param name: None or str new file name
+        :param add_parents: None or str id of folder to add the file to
+        :param remove_parents: None or str id of folder to remove the file from
+        :param app_properties: None or dict of private application properties, None values are removed
+        :return GoogleDriveFile of updated file
+        """
+        file = api.update_file(file_id, name, add_parents, remove_parents, app_properties, self.drive_service)
+        return self.get_file(file)
+
     def merge_template(self, id_to_merge, merge_fields):
         """
         Merge fields in file - replace {{fields}} with strings
         :param id_to_merge: FileID of Doc to merge
         :param merge_fields: dict of fields to replace {'{{replace me}}': 'with me'}
+        :return: int number of replacements made
         """
-        api.merge_template(id_to_merge, merge_fields, self.docs_service)
+        return api.merge_template(id_to_merge, merge_fields, self.docs_service)
+
+    def bulk_merge(self, doc_ids, merge_fields, max_workers=4, max_per_minute=60, num_retries=5):
+        """
+        Merge fields in many files concurrently - replace {{fields}} with strings
+        :param doc_ids: list of FileIDs of Docs to merge
+        :param merge_fields: dict of fields to replace {'{{replace me}}': 'with me'}
+        :param max_workers: int maximum number of concurrent requests
+        :param max_per_minute: float maximum number of requests per minute (Docs API write quota)
+        :param num_retries: int number of retries with exponential backoff if quota is exceeded
+        :return: replacements, failures
+            replacements: dict {doc_id: number of replacements}, documents with no replacements are not included
+            failures: list of dicts {'document': doc_id, 'error': str} of documents that could not be merged
+        """
+        limiter = RateLimiter(max_per_minute)
+        docs_service = self.docs_service
+
+        def merge(doc_id):
+            limiter.wait()
+            return api.merge_template(doc_id, merge_fields, docs_service, num_retries=num_retries)
+
+        replacements = {}
+        failures = []
+        with ThreadPoolExecutor(max_workers) as executor:
+            futures = [(doc_id, executor.submit(merge, doc_id)) for doc_id in doc_ids]
+            for doc_id, future in futures:
+                try:
+                    occurrences = future.result()
+                except Exception as e:
+                    print('Merge failed for %s: %s' % (doc_id, e))
+                    failures.append({'document': doc_id, 'error': str(e)})
+                    continue
+                if occurrences:
+                    replacements[doc_id] = occurrences
+        print('Bulk merge: %d of %d documents changed, %d failed' % (len(replacements), len(doc_ids), len(failures)))
+        return replacements, failures
 
     def append_text(self, doc_id, text_to_append=''):
         """
@@ -126,14 +344,90 @@ class GoogleDriveApi:
         """
         api.append_text(doc_id, text_to_append, self.docs_service)
 
+    def append_text_stream(self, doc_id, source, folder_id=None, chunk_size=api.TEXT_CHUNK_SIZE,
+                           attach_size=api.TEXT_ATTACH_SIZE):
+        """
+        Append large text to end of a GoogleDoc, reading it in chunks
+        Text larger than attach_size bytes is uploaded to Drive and a link is appended instead.
+        :param doc_id: str GoogleDoc id
+        :param source: str filename of an existing file, or iterable of str (e.g. open file, [text])
+        :param folder_id: None or id of Drive folder to add attached files to
+        :param chunk_size: int maximum number of characters per insertText request
+        :param attach_size: int size in bytes above which the text is attached as a Drive file
+        """
+        api.append_text_stream(doc_id, source, chunk_size, attach_size=attach_size, folder_id=folder_id,
+                               drive_service=self.drive_service, docs_service=self.docs_service)
+
     def append_image(self, doc_id, image_loc='', folder_id=None):
         """
         Append image to end of Goodle Doc
         :param doc_id: str GoogleDoc id
         :param image_loc: location of file, either local filename or http link
         :param folder_id: None or id of Drive folder to add image to
+        :return: str objectId of inserted image
+        """
+        return api.append_image(doc_id, image_loc, folder_id, self.docs_service, drive_service=self.drive_service)
+
+    def append_text_async(self, doc_id, text_to_append=''):
+        """
+        Append text to end of a GoogleDoc in the interactive lane of the scheduler
+        Writes to the same document are made one at a time, in the order they are queued.
+        :param doc_id: str GoogleDoc id
+        :param text_to_append: str text to add to end of file
+        :return: concurrent.futures.Future
+        """
+        return self.scheduler.submit(api.append_text, doc_id, text_to_append, self.docs_service,
+                                     lane=INTERACTIVE, key=doc_id)
+
+    def append_image_async(self, doc_id, image_loc='', folder_id=None):
+        """
+        Append image to end of Goodle Doc using the scheduler
+        The image is uploaded in the images lane, so large uploads don't delay text appends. The insert
+        joins the document's queue when the upload finishes, so the image is placed after any appends
+        to the same document made during the upload.
+        :param doc_id: str GoogleDoc id
+        :param image_loc: location of file, either local filename or http link
+        :param folder_id: None or id of Drive folder to add image to
+        :return: concurrent.futures.Future, result is the objectId of the inserted image
+        """
+        if image_loc.startswith('http'):
+            return self.scheduler.submit(api.append_image, doc_id, image_loc, docs_service=self.docs_service,
+                                         lane=INTERACTIVE, key=doc_id)
+        upload = self.scheduler.submit(api.upload_file, image_loc, folder_id, drive_service=self.drive_service,
+                                       lane=IMAGES)
+
+        def append():
+            return api.append_image(doc_id, upload.result(), docs_service=self.docs_service)
+        return self.scheduler.submit(append, lane=INTERACTIVE, key=doc_id, after=upload)
+
+    def download_pdf_async(self, file_id, local_filename):
+        """
+        Download GoogleDoc to pdf in the bulk lane of the scheduler, after any pending appends
+        :param file_id: str, FileID
+        :param local_filename: str pdf filename
+        :return: concurrent.futures.Future
+        """
+        return self.scheduler.submit(api.download_pdf, file_id, local_filename, self.drive_service,
+                                     lane=BULK, key=file_id)
+
+    def live_image(self, doc_id, min_interval=10, folder_id=None):
+        """
+        Create a LiveImage, an image in the GoogleDoc that is replaced in place as it is updated
+        :param doc_id: str GoogleDoc id
+        :param min_interval: float minimum time in seconds between updates
+        :param folder_id: None or id of Drive folder to add image to
+        :return: LiveImage
         """
-        api.append_image(doc_id, image_loc, folder_id, docs_service=self.docs_service)
+        return LiveImage(self, doc_id, min_interval, folder_id)
+
+    def new_entry(self, doc_id, image_folder_id=None):
+        """
+        Create a DocumentBuilder to write a formatted entry to the end of a GoogleDoc
+        :param doc_id: str GoogleDoc id
+        :param image_folder_id: None or id of Drive folder to add images to
+        :return: DocumentBuilder, call .write() to add the entry
+        """
+        return DocumentBuilder(doc_id, self.docs_service, self.drive_service, image_folder_id)
 
 
 class GoogleDriveFile:
@@ -143,26 +437,26 @@ class GoogleDriveFile:
     api = GoogleDriveApi('creds.json')
     file = GoogleDriveFile('asboide', api)
 
+    File metadata is only requested when name or link are first read. Use
+    GoogleDriveApi.hydrate(files) to request the metadata of many files in one batch.
+
     :param file: str or dict with field 'id'
     :param gdriveapi: GoogleDriveApi
     """
-    name = ''
-    link = None
+    __slots__ = ('id', 'gdriveapi', '_name', '_link')
 
     def __init__(self, file, gdriveapi):
-        self.drive_service = gdriveapi.drive_service
-        self.docs_service = gdriveapi.docs_service
+        self.gdriveapi = gdriveapi
+        self._name = None
+        self._link = None
 
         try:
             self.id = file['id']
         except TypeError:
             # file_dict is str
             self.id = file
-        if 'name' in file and 'webViewLink' in file:
-            self.name = file['name']
-            self.link = file['webViewLink']
         else:
-            self._update_file_dict()
+            self._set_file_dict(file)
 
     def __repr__(self):
         return "GoogleDriveFile('%s')" % self.id
@@ -174,10 +468,38 @@ class GoogleDriveFile:
         out += '  File link: %s\n' % self.link
         return out
 
+    @property
+    def drive_service(self):
+        return self.gdriveapi.drive_service
+
+    @property
+    def docs_service(self):
+        return self.gdriveapi.docs_service
+
+    @property
+    def name(self):
+        if self._name is None:
+            self._update_file_dict()
+        return self._name
+
+    @property
+    def link(self):
+        if self._link is None:
+            self._update_file_dict()
+        return self._link
+
+    @property
+    def is_loaded(self):
+        """True if file metadata has been requested"""
+        return self._name is not None and self._link is not None
+
+    def _set_file_dict(self, file):
+        self._name = file.get('name', self._name)
+        self._link = file.get('webViewLink', self._link)
+
     def _update_file_dict(self):
         file = api.get_drive_file_dict(self.id, self.drive_service)
-        self.name = file['name']
-        self.link = file['webViewLink']
+        self._set_file_dict(file)
 
     def get_metadata(self, fields='*'):
         """
@@ -185,7 +507,7 @@ class GoogleDriveFile:
         :param fields: str, list of metadata fields, e.g. 'id, name, webContentLink, webViewLink'
         :return: dict
         """
-        return api.get_drive_file_metadata(self.id, fields)
+        return api.get_drive_file_metadata(self.id, fields, self.drive_service)
 
     def change_permission(self, can_edit=False):
         """
@@ -194,6 +516,24 @@ class GoogleDriveFile:
         """
         api.change_permission(self.id, can_edit, self.drive_service)
 
+    def share(self, emails, role='writer', send_notification=False):
+        """
+        Give users permission to view or edit the file
+        :param emails: list of str user email addresses
+        :param role: str 'reader', 'commenter' or 'writer'
+        :param send_notification: bool, if True, users are sent a notification email
+        :return: int number of permissions created
+        """
+        return api.share_files([self.id], emails, role, send_notification, self.drive_service)
+
+    def revoke(self, emails):
+        """
+        Remove user permissions from the file
+        :param emails: list of str user email addresses
+        :return: int number of permissions removed
+        """
+        return api.revoke_files([self.id], emails, self.drive_service)
+
     def download_pdf(self, local_filename):
         """
         Download file to pdf on local filesystem
@@ -205,8 +545,9 @@ class GoogleDriveFile:
         """
         Merge fields in file - replace {{fields}} with strings
         :param merge_fields: dict of fields to replace {'{{replace me}}': 'with me'}
+        :return: int number of replacements made
         """
-        api.merge_template(self.id, merge_fields, self.docs_service)
+        return api.merge_template(self.id, merge_fields, self.docs_service)
 
     def append_text(self, text_to_append):
         """
@@ -215,10 +556,119 @@ class GoogleDriveFile:
         """
         api.append_text(self.id, text_to_append, self.docs_service)
 
+    def append_text_stream(self, source, folder_id=None):
+        """
+        Append large text to the end of the file, reading it in chunks
+        :param source: str filename of an existing file, or iterable of str (e.g. open file, [text])
+        :param folder_id: None or ID of Drive folder to add attached files to
+        """
+        api.append_text_stream(self.id, source, folder_id=folder_id,
+                               drive_service=self.drive_service, docs_service=self.docs_service)
+
     def append_image(self, image_loc, image_folder_id=None):
         """
         Append a image to the end of the file
         :param image_loc: location of file, either local filename or http link
         :param image_folder_id: None or ID of Drive folder to add image to
+        :return: str objectId of inserted image
+        """
+        return api.append_image(self.id, image_loc, image_folder_id, self.docs_service,
+                                drive_service=self.drive_service)
+
+    def live_image(self, min_interval=10, image_folder_id=None):
+        """
+        Create a LiveImage, an image at the end of the file that is replaced in place as it is updated
+        :param min_interval: float minimum time in seconds between updates
+        :param image_folder_id: None or ID of Drive folder to add image to
+        :return: LiveImage
+        """
+        return LiveImage(self.gdriveapi, self.id, min_interval, image_folder_id)
+
+    def new_entry(self, image_folder_id=None):
+        """
+        Create a DocumentBuilder to write a formatted entry to the end of the file
+        :param image_folder_id: None or ID of Drive folder to add images to
+        :return: DocumentBuilder, call .write() to add the entry
+        """
+        return DocumentBuilder(self.id, self.docs_service, self.drive_service, image_folder_id)
+
+
+class LiveImage:
+    """
+    Image in a GoogleDoc that is replaced in place, e.g. a plot of a running scan
+    The image is uploaded and appended to the document on the first update. Later updates
+    replace the contents of the same Drive file and the image in the document, so the document
+    and Drive only ever hold the latest frame. Updates more frequent than min_interval are skipped,
+    finish() always writes the final frame.
+
+    live = LiveImage(gdrive, 'doc_id', min_interval=10)
+    for frame in scan:
+        fig.savefig('live.png')
+        live.update('live.png')
+    live.finish('live.png')
+
+    :param gdriveapi: GoogleDriveApi
+    :param doc_id: str GoogleDoc id
+    :param min_interval: float minimum time in seconds between updates
+    :param folder_id: None or id of Drive folder to add image to
+    """
+    __slots__ = ('gdriveapi', 'doc_id', 'min_interval', 'folder_id', 'file_id', 'link', 'object_id',
+                 'n_updates', '_last_update', '_pending')
+
+    def __init__(self, gdriveapi, doc_id, min_interval=10, folder_id=None):
+        self.gdriveapi = gdriveapi
+        self.doc_id = doc_id
+        self.min_interval = min_interval
+        self.folder_id = folder_id
+        self.file_id = None
+        self.link = None
+        self.object_id = None
+        self.n_updates = 0
+        self._last_update = 0
+        self._pending = None
+
+    def __repr__(self):
+        return "LiveImage('%s', object_id=%s, updates=%d)" % (self.doc_id, self.object_id, self.n_updates)
+
+    def _write(self, image_file):
+        """Upload image file and insert or replace the image in the document"""
+        drive_service = self.gdriveapi.drive_service
+        docs_service = self.gdriveapi.docs_service
+        if self.object_id is None:
+            file = api.create_file(image_file, self.folder_id, drive_service=drive_service)
+            self.file_id = file['id']
+            self.link = file['webContentLink']
+            self.object_id = api.append_image(self.doc_id, self.link, docs_service=docs_service)
+        else:
+            api.update_file_content(self.file_id, image_file, drive_service)
+            # change the uri each update so the new contents are fetched
+            uri = '%s&update=%d' % (self.link, self.n_updates)
+            api.replace_image(self.doc_id, self.object_id, uri, docs_service)
+        self.n_updates += 1
+        self._last_update = time.time()
+        self._pending = None
+
+    def update(self, image_file, force=False):
+        """
+        Update the image, if at least min_interval seconds have passed since the last update
+        :param image_file: str local filename of image
+        :param force: bool, if True, update regardless of the time since the last update
+        :return: bool, True if the image was written
+        """
+        if force or self.object_id is None or time.time() - self._last_update >= self.min_interval:
+            self._write(image_file)
+            return True
+        self._pending = image_file
+        return False
+
+    def finish(self, image_file=None):
+        """
+        Write the final frame
+        :param image_file: None or str local filename of final image, if None the last skipped frame is written
+        :return: bool, True if the image was written
         """
-        api.append_image(self.id, image_loc, image_folder_id, docs_service=self.docs_service)
+        image_file = image_file or self._pending
+        if image_file is None:
+            return False
+        self._write(image_file)
+        return True
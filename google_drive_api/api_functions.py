@@ -9,17 +9,38 @@ Diamond Light Source Ltd
 """
 
 import io
+import mimetypes
 import os
+import re
+import tempfile
 
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
+# The Google API modules are slow to import, so are imported in the functions that use them.
 
 # If modifying these scopes, delete the file token.json.
 SCOPES = ['https://www.googleapis.com/auth/drive']
 
+# Limits for streamed text appends
+TEXT_CHUNK_SIZE = 20000  # characters per insertText request
+TEXT_BATCH_SIZE = 10  # insertText requests per batchUpdate
+TEXT_ATTACH_SIZE = 5000000  # bytes, larger text is uploaded to Drive and linked instead
+UPLOAD_CHUNK_SIZE = 10 * 1024 * 1024  # bytes per resumable upload request
+DOWNLOAD_CHUNK_SIZE = 10 * 1024 * 1024  # bytes per download request
+
+# Characters removed from inserted text by GoogleDocs
+DOCS_STRIPPED_CHARS = re.compile(r'[\x00-\x08\x0c-\x1f\ue000-\uf8ff]')
+FOLDER_MIMETYPE = 'application/vnd.google-apps.folder'
+
+
+def build(service_name, version, **kwargs):
+    """
+    Build a Google API service, see googleapiclient.discovery.build
+    :param service_name: str name of service, e.g. 'drive', 'docs'
+    :param version: str version of service, e.g. 'v3'
+    :return: googleapiclient Resource
+    """
+    from googleapiclient.discovery import build as discovery_build
+    return discovery_build(service_name, version, **kwargs)
+
 
 def signin(credentials_file='credentials.json', token_file='token.json'):
     """
@@ -31,6 +52,9 @@ def signin(credentials_file='credentials.json', token_file='token.json'):
     :param token_file: filename of token.json (doesn't need to exist, but will be created)
     :return: credentials
     """
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
 
     creds = None
     # The file token.json stores the user's access and refresh tokens, and is
@@ -51,16 +75,35 @@ def signin(credentials_file='credentials.json', token_file='token.json'):
     return creds
 
 
-def build_services(creds=None):
+def build_services(creds=None, pool_size=None, timeout=60, trace_file=None):
     """
     Build Google Drive API services
+    If pool_size is given, the services share a thread-safe pool of keep-alive connections,
+    otherwise the default httplib2 transport is used, which is not thread-safe.
     :param creds: GoogleDocsAPI credentials
+    :param pool_size: None or int maximum number of pooled connections
+    :param timeout: float request timeout in seconds, used with pool_size
+    :param trace_file: None or str filename, if given every request is recorded, see google_drive_api.trace
     :return: drive_service, docs_service
     """
     if creds is None:
         creds = signin()
-    drive_service = build('drive', 'v3', credentials=creds)
-    docs_service = build('docs', 'v1', credentials=creds)
+    if pool_size:
+        from google_drive_api.transport import PooledHttp
+        http = PooledHttp(creds, pool_size=pool_size, timeout=timeout)
+    elif trace_file:
+        import httplib2
+        from google_auth_httplib2 import AuthorizedHttp
+        http = AuthorizedHttp(creds, http=httplib2.Http())
+    else:
+        drive_service = build('drive', 'v3', credentials=creds)
+        docs_service = build('docs', 'v1', credentials=creds)
+        return drive_service, docs_service
+    if trace_file:
+        from google_drive_api.trace import TracingHttp
+        http = TracingHttp(http, trace_file)
+    drive_service = build('drive', 'v3', http=http, cache_discovery=False)
+    docs_service = build('docs', 'v1', http=http, cache_discovery=False)
     return drive_service, docs_service
 
 
@@ -76,10 +119,81 @@ def get_drive_file_dict(file_id, drive_service=None, creds=None):
         if creds is None:
             creds = signin()
         drive_service = build('drive', 'v3', credentials=creds)
-    file = drive_service.files().get(fileId=file_id, fields='id, name, webContentLink, webViewLink').execute()
+    file = drive_service.files().get(fileId=file_id, fields='id, name, webContentLink, webViewLink',
+                                     supportsAllDrives=True).execute()
     return file
 
 
+def batch_execute(requests, service, batch_size=100):
+    """
+    Execute a list of requests using batch requests
+    :param requests: list of HttpRequests, e.g. [drive_service.files().get(fileId=file_id), ...]
+    :param service: GoogleDriveAPI or GoogleDocsAPI service that created the requests
+    :param batch_size: int maximum number of requests per batch (max 100 for Drive)
+    :return: list of (response, exception) for each request, in the same order
+    """
+    results = [(None, None)] * len(requests)
+
+    def callback(request_id, response, exception):
+        results[int(request_id)] = (response, exception)
+
+    for start in range(0, len(requests), batch_size):
+        batch = service.new_batch_http_request(callback=callback)
+        for n in range(start, min(start + batch_size, len(requests))):
+            batch.add(requests[n], request_id=str(n))
+        batch.execute()
+    return results
+
+
+def batch_execute_per_file(file_requests, service, batch_size=100):
+    """
+    Execute requests using batch requests, with at most one request for each file in each batch
+    Drive doesn't support concurrent permission changes on the same file, so e.g. sharing a file
+    with several users takes one batch per user.
+    :param file_requests: list of (file_id, HttpRequest)
+    :param service: GoogleDriveAPI service that created the requests
+    :param batch_size: int maximum number of requests per batch (max 100 for Drive)
+    :return: list of (response, exception) for each request, in the same order
+    """
+    rounds = []  # rounds[n] = list of positions of the n-th request for each file
+    file_counts = {}
+    for position, (file_id, request) in enumerate(file_requests):
+        n = file_counts.get(file_id, 0)
+        file_counts[file_id] = n + 1
+        if n == len(rounds):
+            rounds.append([])
+        rounds[n].append(position)
+    results = [(None, None)] * len(file_requests)
+    for positions in rounds:
+        round_results = batch_execute([file_requests[position][1] for position in positions], service, batch_size)
+        for position, result in zip(positions, round_results):
+            results[position] = result
+    return results
+
+
+def get_drive_file_dicts(file_ids, fields='id, name, webContentLink, webViewLink', drive_service=None, creds=None):
+    """
+    Get metadata of several files using batch requests
+    :param file_ids: list of str FileIDs
+    :param fields: str, list of metadata fields, e.g. 'id, name, webContentLink, webViewLink'
+    :param drive_service: GoogleDriveAPI service
+    :param creds: GoogleDocsAPI credentials
+    :return: list of dict Drive file details, or None where the request failed
+    """
+    if drive_service is None:
+        if creds is None:
+            creds = signin()
+        drive_service = build('drive', 'v3', credentials=creds)
+
+    requests = [drive_service.files().get(fileId=file_id, fields=fields, supportsAllDrives=True) for file_id in file_ids]
+    files = []
+    for file_id, (file, exception) in zip(file_ids, batch_execute(requests, drive_service)):
+        if exception is not None:
+            print('Failed to get file %s: %s' % (file_id, exception))
+        files.append(file)
+    return files
+
+
 def get_drive_file_metadata(file_id, fields='*', drive_service=None, creds=None):
     """
     Get sharable link for file
@@ -93,7 +207,7 @@ def get_drive_file_metadata(file_id, fields='*', drive_service=None, creds=None)
         if creds is None:
             creds = signin()
         drive_service = build('drive', 'v3', credentials=creds)
-    file = drive_service.files().get(fileId=file_id, fields=fields).execute()
+    file = drive_service.files().get(fileId=file_id, fields=fields, supportsAllDrives=True).execute()
     return file
 
 
@@ -109,18 +223,65 @@ def get_drive_file_link(file_id, drive_service=None, creds=None):
         if creds is None:
             creds = signin()
         drive_service = build('drive', 'v3', credentials=creds)
-    file = drive_service.files().get(fileId=file_id, fields='webViewLink').execute()
+    file = drive_service.files().get(fileId=file_id, fields='webViewLink', supportsAllDrives=True).execute()
     return file.get('webViewLink')
 
 
-def find_filename(filename, drive_service=None, creds=None):
+def escape_query(value):
     """
-    Returns list of files with this filename in Drive
-     output file dicts has fields: 'id', 'name', 'webContentLink'
-    :param filename: str name of file to search for
+    Escape a string value for use in a Drive search query
+    :param value: str
+    :return: str with backslashes and single quotes escaped
+    """
+    return str(value).replace('\\', '\\\\').replace("'", "\\'")
+
+
+def build_query(name=None, folder_id=None, mime_type=None, trashed=False, name_contains=None, query=None):
+    """
+    Build a Drive search query string
+    :param name: None or str exact file name
+    :param folder_id: None or str id of parent folder
+    :param mime_type: None or str mimeType, e.g. 'application/vnd.google-apps.document'
+    :param trashed: None or bool, if None, trashed files are included
+    :param name_contains: None or str part of file name
+    :param query: None or str additional query terms
+    :return: str query
+    """
+    terms = []
+    if name is not None:
+        terms.append("name = '%s'" % escape_query(name))
+    if name_contains is not None:
+        terms.append("name contains '%s'" % escape_query(name_contains))
+    if folder_id is not None:
+        terms.append("'%s' in parents" % escape_query(folder_id))
+    if mime_type is not None:
+        terms.append("mimeType = '%s'" % escape_query(mime_type))
+    if trashed is not None:
+        terms.append('trashed = %s' % ('true' if trashed else 'false'))
+    if query:
+        terms.append('(%s)' % query)
+    return ' and '.join(terms)
+
+
+def iter_files(name=None, folder_id=None, mime_type=None, trashed=False, name_contains=None, query=None,
+               fields='id, name, webContentLink, webViewLink', page_size=100, max_results=None,
+               drive_id=None, drive_service=None, creds=None):
+    """
+    Generator of files in Drive matching a search
+    Pages are requested as the generator is consumed, so stopping early avoids further requests.
+    :param name: None or str exact file name
+    :param folder_id: None or str id of parent folder
+    :param mime_type: None or str mimeType, e.g. 'application/vnd.google-apps.document'
+    :param trashed: None or bool, if None, trashed files are included
+    :param name_contains: None or str part of file name
+    :param query: None or str additional query terms
+    :param fields: str file fields to return, e.g. 'id, name'
+    :param page_size: int number of files per request (max 1000)
+    :param max_results: None or int maximum number of files to return
+    :param drive_id: None or str id of Shared Drive, if given only this drive is searched
     :param drive_service: GoogleDriveAPI service
     :param creds: GoogleDocsAPI credentials
-    :return: list of file dicts
+    :return: generator of file dicts
     """
 
     if drive_service is None:
@@ -128,22 +289,41 @@ def find_filename(filename, drive_service=None, creds=None):
             creds = signin()
         drive_service = build('drive', 'v3', credentials=creds)
 
-    files = []
+    q = build_query(name, folder_id, mime_type, trashed, name_contains, query)
+    if max_results:
+        page_size = min(page_size, max_results)
+    options = {'corpora': 'drive', 'driveId': drive_id} if drive_id else {}
+    n_results = 0
     page_token = None
     while True:
-        response = drive_service.files().list(q="name = '%s'" % filename,
+        response = drive_service.files().list(q=q,
                                               spaces='drive',
-                                              fields='nextPageToken, files(id, name, webContentLink, webViewLink)',
-                                              pageToken=page_token).execute()
+                                              pageSize=page_size,
+                                              fields='nextPageToken, files(%s)' % fields,
+                                              pageToken=page_token,
+                                              supportsAllDrives=True,
+                                              includeItemsFromAllDrives=True,
+                                              **options).execute()
         for file in response.get('files', []):
-            # Process change
-            # print('Found file: %s (%s)' % (file.get('name'), file.get('id')))
-            # print('webViewLink: %s' % file.get('webContentLink'))
-            files += [file]
+            yield file
+            n_results += 1
+            if max_results and n_results >= max_results:
+                return
         page_token = response.get('nextPageToken', None)
         if page_token is None:
-            break
-    return files
+            return
+
+
+def find_filename(filename, drive_service=None, creds=None):
+    """
+    Returns list of files with this filename in Drive
+     output file dicts has fields: 'id', 'name', 'webContentLink'
+    :param filename: str name of file to search for
+    :param drive_service: GoogleDriveAPI service
+    :param creds: GoogleDocsAPI credentials
+    :return: list of file dicts
+    """
+    return list(iter_files(name=filename, drive_service=drive_service, creds=creds))
 
 
 def change_permission(file_id, can_edit=False, drive_service=None, creds=None):
@@ -171,13 +351,109 @@ def change_permission(file_id, can_edit=False, drive_service=None, creds=None):
         fileId=file_id,
         body=user_permission,
         fields='id',
+        supportsAllDrives=True,
     ).execute()
     print('Permissions changed to %s for everyone' % role)
 
 
+def share_files(file_ids, emails, role='writer', send_notification=False, drive_service=None, creds=None):
+    """
+    Give users permission to view or edit files, using batch requests
+    :param file_ids: list of str FileIDs
+    :param emails: list of str user email addresses
+    :param role: str 'reader', 'commenter' or 'writer'
+    :param send_notification: bool, if True, users are sent a notification email
+    :param drive_service: GoogleDriveAPI service
+    :param creds: GoogleDocsAPI credentials
+    :return: int number of permissions created, a warning is printed if less than len(file_ids) * len(emails)
+    """
+
+    if drive_service is None:
+        if creds is None:
+            creds = signin()
+        drive_service = build('drive', 'v3', credentials=creds)
+
+    requests = []
+    targets = []
+    for file_id in file_ids:
+        for email in emails:
+            user_permission = {
+                'type': 'user',
+                'role': role,
+                'emailAddress': email,
+            }
+            requests.append((file_id, drive_service.permissions().create(
+                fileId=file_id,
+                body=user_permission,
+                sendNotificationEmail=send_notification,
+                fields='id',
+                supportsAllDrives=True,
+            )))
+            targets.append((file_id, email))
+    n_shared = 0
+    for (file_id, email), (response, exception) in zip(targets, batch_execute_per_file(requests, drive_service)):
+        if exception is not None:
+            print('Sharing %s with %s failed: %s' % (file_id, email, exception))
+        else:
+            n_shared += 1
+    print('Shared %d files with %d users as %s: %d of %d permissions created' % (
+        len(file_ids), len(emails), role, n_shared, len(requests)))
+    if n_shared < len(requests):
+        print('WARNING: %d permissions were not created' % (len(requests) - n_shared))
+    return n_shared
+
+
+def revoke_files(file_ids, emails, drive_service=None, creds=None):
+    """
+    Remove user permissions from files, using batch requests
+    :param file_ids: list of str FileIDs
+    :param emails: list of str user email addresses
+    :param drive_service: GoogleDriveAPI service
+    :param creds: GoogleDocsAPI credentials
+    :return: int number of permissions removed
+    """
+
+    if drive_service is None:
+        if creds is None:
+            creds = signin()
+        drive_service = build('drive', 'v3', credentials=creds)
+
+    emails = [email.lower() for email in emails]
+    requests = [
+        drive_service.permissions().list(fileId=file_id, fields='permissions(id, type, role, emailAddress)',
+                                         supportsAllDrives=True)
+        for file_id in file_ids
+    ]
+    delete_requests = []
+    for file_id, (response, exception) in zip(file_ids, batch_execute(requests, drive_service)):
+        if exception is not None:
+            print('Failed to list permissions of %s: %s' % (file_id, exception))
+            continue
+        for permission in response.get('permissions', []):
+            if permission.get('role') == 'owner':
+                continue
+            if permission.get('emailAddress', '').lower() in emails:
+                delete_requests.append((
+                    file_id,
+                    drive_service.permissions().delete(fileId=file_id, permissionId=permission['id'],
+                                                       supportsAllDrives=True)
+                ))
+    n_removed = 0
+    for response, exception in batch_execute_per_file(delete_requests, drive_service):
+        if exception is not None:
+            print('Failed to remove permission: %s' % exception)
+        else:
+            n_removed += 1
+    print('Removed %d of %d permissions' % (n_removed, len(delete_requests)))
+    if n_removed < len(delete_requests):
+        print('WARNING: %d permissions were not removed' % (len(delete_requests) - n_removed))
+    return n_removed
+
+
 def upload_file(filename, folder_id=None, drive_service=None, creds=None):
     """
     Upload a local file to Google Drive. If the file exists already, return the previous file link
+    If folder_id is given, only files in that folder are checked.
     :param filename: local filename to upload
     :param folder_id: None or id of folder
     :param drive_service: GoogleDriveAPI service
@@ -191,27 +467,13 @@ def upload_file(filename, folder_id=None, drive_service=None, creds=None):
         drive_service = build('drive', 'v3', credentials=creds)
 
     name = os.path.basename(filename)
-    already_uploaded = find_filename(name, drive_service)
+    already_uploaded = list(iter_files(name=name, folder_id=folder_id, drive_service=drive_service))
     if already_uploaded:
         print('%s already uploaded!' % filename)
         file = already_uploaded[-1]
+        change_permission(file.get('id'), drive_service=drive_service)
     else:
-        file_metadata = {
-            'name': name,
-        }
-        if folder_id:
-            file_metadata['parents'] = folder_id
-
-        print(file_metadata)
-        media = MediaFileUpload(filename,
-                                mimetype='image/jpeg',
-                                resumable=True)
-        file = drive_service.files().create(body=file_metadata,
-                                            media_body=media,
-                                            fields='id, name, webContentLink, webViewLink').execute()
-        print('File uploaded: %s' % filename)
-
-    change_permission(file.get('id'), drive_service)
+        file = create_file(filename, folder_id, drive_service=drive_service)
 
     print('File name: %s' % file.get('name'))
     print('File ID: %s' % file.get('id'))
@@ -219,6 +481,69 @@ def upload_file(filename, folder_id=None, drive_service=None, creds=None):
     return file.get('webContentLink')
 
 
+def create_file(filename, folder_id=None, share=True, drive_service=None, creds=None):
+    """
+    Upload a local file to Google Drive as a new file
+    :param filename: local filename to upload
+    :param folder_id: None or id of folder
+    :param share: bool, if True, anyone can view the file
+    :param drive_service: GoogleDriveAPI service
+    :param creds: GoogleDocsAPI credentials
+    :return: dict Drive file details, with fields 'id', 'name', 'webContentLink', 'webViewLink'
+    """
+
+    if drive_service is None:
+        if creds is None:
+            creds = signin()
+        drive_service = build('drive', 'v3', credentials=creds)
+
+    file_metadata = {
+        'name': os.path.basename(filename),
+    }
+    if folder_id:
+        file_metadata['parents'] = [folder_id]
+
+    print(file_metadata)
+    from googleapiclient.http import MediaFileUpload
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    media = MediaFileUpload(filename,
+                            mimetype=mimetype,
+                            resumable=True)
+    file = drive_service.files().create(body=file_metadata,
+                                        media_body=media,
+                                        fields='id, name, webContentLink, webViewLink',
+                                        supportsAllDrives=True).execute()
+    print('File uploaded: %s' % filename)
+    if share:
+        change_permission(file.get('id'), drive_service=drive_service)
+    return file
+
+
+def update_file_content(file_id, filename, drive_service=None, creds=None):
+    """
+    Replace the contents of a file in Google Drive with a local file, keeping the same ID and link
+    :param file_id: str, FileID
+    :param filename: local filename to upload
+    :param drive_service: GoogleDriveAPI service
+    :param creds: GoogleDocsAPI credentials
+    :return: dict Drive file details, with fields 'id', 'name', 'webContentLink', 'webViewLink'
+    """
+
+    if drive_service is None:
+        if creds is None:
+            creds = signin()
+        drive_service = build('drive', 'v3', credentials=creds)
+
+    from googleapiclient.http import MediaFileUpload
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    media = MediaFileUpload(filename, mimetype=mimetype, resumable=True)
+    file = drive_service.files().update(fileId=file_id,
+                                        media_body=media,
+                                        fields='id, name, webContentLink, webViewLink',
+                                        supportsAllDrives=True).execute()
+    return file
+
+
 def download_pdf(file_id, local_filename, drive_service=None, creds=None):
     """
     Download GoogldDoc to pdf on local filesystem
@@ -233,6 +558,7 @@ def download_pdf(file_id, local_filename, drive_service=None, creds=None):
             creds = signin()
         drive_service = build('drive', 'v3', credentials=creds)
 
+    from googleapiclient.http import MediaIoBaseDownload
     request = drive_service.files().export_media(fileId=file_id, mimeType='application/pdf')
     fh = io.FileIO(local_filename, 'wb')  # this can be used to write to disk
     downloader = MediaIoBaseDownload(fh, request)
@@ -243,13 +569,64 @@ def download_pdf(file_id, local_filename, drive_service=None, creds=None):
     print('Downloaded: %s' % local_filename)
 
 
-def copy_file(id_to_copy, new_file_name, drive_service=None, creds=None):
+def export_file(file_id, mime_type, fh, chunksize=DOWNLOAD_CHUNK_SIZE, drive_service=None, creds=None):
+    """
+    Export a Google Workspace file to a file object, in chunks
+    :param file_id: str, FileID
+    :param mime_type: str export format, e.g. 'application/pdf', 'text/plain'
+    :param fh: writable binary file object, e.g. io.BytesIO()
+    :param chunksize: int bytes per download request
+    :param drive_service: GoogleDriveAPI service
+    :param creds: GoogleDocsAPI credentials
+    :return: fh
+    """
+    if drive_service is None:
+        if creds is None:
+            creds = signin()
+        drive_service = build('drive', 'v3', credentials=creds)
+
+    from googleapiclient.http import MediaIoBaseDownload
+    request = drive_service.files().export_media(fileId=file_id, mimeType=mime_type)
+    downloader = MediaIoBaseDownload(fh, request, chunksize=chunksize)
+    done = False
+    while done is False:
+        status, done = downloader.next_chunk()
+    return fh
+
+
+def download_file(file_id, fh, chunksize=DOWNLOAD_CHUNK_SIZE, drive_service=None, creds=None):
+    """
+    Download the contents of a file in Google Drive to a file object, in chunks
+    :param file_id: str, FileID
+    :param fh: writable binary file object, e.g. io.BytesIO()
+    :param chunksize: int bytes per download request
+    :param drive_service: GoogleDriveAPI service
+    :param creds: GoogleDocsAPI credentials
+    :return: fh
+    """
+    if drive_service is None:
+        if creds is None:
+            creds = signin()
+        drive_service = build('drive', 'v3', credentials=creds)
+
+    from googleapiclient.http import MediaIoBaseDownload
+    request = drive_service.files().get_media(fileId=file_id, supportsAllDrives=True)
+    downloader = MediaIoBaseDownload(fh, request, chunksize=chunksize)
+    done = False
+    while done is False:
+        status, done = downloader.next_chunk()
+    return fh
+
+
+def copy_file(id_to_copy, new_file_name, drive_service=None, creds=None, folder_id=None, app_properties=None):
     """
     Copy a file in Google Drive to a new file, return the new ID
     :param id_to_copy: str, FileID
     :param new_file_name: str, new file name
     :param drive_service: GoogleDriveAPI service
     :param creds: GoogleDocsAPI credentials
+    :param folder_id: None or id of folder to put the copy in
+    :param app_properties: None or dict of private application properties {'key': 'value'}
     :return: copied file ID
     """
 
@@ -258,20 +635,114 @@ def copy_file(id_to_copy, new_file_name, drive_service=None, creds=None):
             creds = signin()
         drive_service = build('drive', 'v3', credentials=creds)
     body = {'name': new_file_name}
+    if folder_id:
+        body['parents'] = [folder_id]
+    if app_properties:
+        body['appProperties'] = app_properties
     print(id_to_copy)
     print(body)
-    copiedfile = drive_service.files().copy(fileId=id_to_copy, body=body).execute()
+    copiedfile = drive_service.files().copy(fileId=id_to_copy, body=body, supportsAllDrives=True).execute()
     return copiedfile['id']
 
 
-def merge_template(id_to_merge, merge_fields, docs_service=None, creds=None):
+def update_file(file_id, name=None, add_parents=None, remove_parents=None, app_properties=None,
+                drive_service=None, creds=None):
+    """
+    Update the name, folder or application properties of a file in Google Drive
+    :param file_id: str, FileID
+    :param name: None or str new file name
+    :param add_parents: None or str id of folder to add the file to
+    :param remove_parents: None or str id of folder to remove the file from
+    :param app_properties: None or dict of private application properties, None values are removed
+    :param drive_service: GoogleDriveAPI service
+    :param creds: GoogleDocsAPI credentials
+    :return: dict Drive file details
+    """
+
+    if drive_service is None:
+        if creds is None:
+            creds = signin()
+        drive_service = build('drive', 'v3', credentials=creds)
+    body = {}
+    if name is not None:
+        body['name'] = name
+    if app_properties is not None:
+        body['appProperties'] = app_properties
+    options = {}
+    if add_parents:
+        options['addParents'] = add_parents
+    if remove_parents:
+        options['removeParents'] = remove_parents
+    file = drive_service.files().update(fileId=file_id, body=body,
+                                        fields='id, name, webContentLink, webViewLink',
+                                        supportsAllDrives=True, **options).execute()
+    return file
+
+
+def create_folder(name, parent_id=None, drive_id=None, app_properties=None, drive_service=None, creds=None):
+    """
+    Create a folder in Google Drive
+    :param name: str folder name
+    :param parent_id: None or id of parent folder
+    :param drive_id: None or id of Shared Drive, used as the parent if parent_id is None
+    :param app_properties: None or dict of private application properties {'key': 'value'}
+    :param drive_service: GoogleDriveAPI service
+    :param creds: GoogleDocsAPI credentials
+    :return: dict Drive file details, with fields 'id', 'name', 'webViewLink'
+    """
+
+    if drive_service is None:
+        if creds is None:
+            creds = signin()
+        drive_service = build('drive', 'v3', credentials=creds)
+    body = {'name': name, 'mimeType': FOLDER_MIMETYPE}
+    parent = parent_id or drive_id
+    if parent:
+        body['parents'] = [parent]
+    if app_properties:
+        body['appProperties'] = app_properties
+    folder = drive_service.files().create(body=body, fields='id, name, webViewLink',
+                                          supportsAllDrives=True).execute()
+    print('Folder created: %s' % name)
+    return folder
+
+
+def trash_files(file_ids, drive_service=None, creds=None):
+    """
+    Move several files to the trash using batch requests, files can be restored from the trash
+    :param file_ids: list of str FileIDs
+    :param drive_service: GoogleDriveAPI service
+    :param creds: GoogleDocsAPI credentials
+    :return: list of FileIDs trashed
+    """
+
+    if drive_service is None:
+        if creds is None:
+            creds = signin()
+        drive_service = build('drive', 'v3', credentials=creds)
+    requests = [
+        drive_service.files().update(fileId=file_id, body={'trashed': True}, fields='id', supportsAllDrives=True)
+        for file_id in file_ids
+    ]
+    trashed = []
+    for file_id, (response, exception) in zip(file_ids, batch_execute(requests, drive_service)):
+        if exception is not None:
+            print('Failed to trash file %s: %s' % (file_id, exception))
+        else:
+            trashed.append(file_id)
+    print('Moved %d files to the trash' % len(trashed))
+    return trashed
+
+
+def merge_template(id_to_merge, merge_fields, docs_service=None, creds=None, num_retries=0):
     """
     Merge fields in file - replace {{fields}} with strings
     :param id_to_merge: FileID of Doc to merge
     :param merge_fields: dict of fields to replace {'{{replace me}}': 'with me'}
     :param docs_service: GoogleDocsAPI service
     :param creds: GoogleDocsAPI credentials
-    :return: None
+    :param num_retries: int number of times to retry with exponential backoff if quota is exceeded
+    :return: int number of replacements made
     """
 
     # Create Google Drive/Docs services, requiring google account credentials
@@ -292,9 +763,178 @@ def merge_template(id_to_merge, merge_fields, docs_service=None, creds=None):
             }
         } for match, replacewith in merge_fields.items()
     ]
-    docs_service.documents().batchUpdate(
-        documentId=id_to_merge, body={'requests': requests}).execute()
-    print('Merge comleted')
+    response = docs_service.documents().batchUpdate(
+        documentId=id_to_merge, body={'requests': requests}).execute(num_retries=num_retries)
+    occurrences = sum(
+        reply.get('replaceAllText', {}).get('occurrencesChanged', 0) for reply in response.get('replies', [])
+    )
+    print('Merge comleted: %d replacements' % occurrences)
+    return occurrences
+
+
+def utf16_len(text):
+    """
+    Return the length of text in Google Docs index units (UTF-16 code units)
+    :param text: str
+    :return: int
+    """
+    return len(text.encode('utf-16-le')) // 2
+
+
+def clean_text(text):
+    """
+    Remove characters that GoogleDocs strips from inserted text, so that indices can be calculated locally
+    :param text: str
+    :return: str
+    """
+    return DOCS_STRIPPED_CHARS.sub('', text)
+
+
+def get_document_end_index(doc_id, docs_service=None, creds=None):
+    """
+    Return the end index of the body of a GoogleDoc, requesting only the endIndex fields
+    :param doc_id: str GoogleDoc id
+    :param docs_service: GoogleDocsAPI service
+    :param creds: GoogleDocsAPI credentials
+    :return: int endIndex of last structural element
+    """
+    if docs_service is None:
+        if creds is None:
+            creds = signin()
+        docs_service = build('docs', 'v1', credentials=creds)
+
+    document = docs_service.documents().get(documentId=doc_id, fields='body.content(endIndex)').execute()
+    content = document['body']['content']
+    return content[-1]['endIndex']
+
+
+def get_document_end(doc_id, docs_service=None, creds=None):
+    """
+    Return the end index of the body of a GoogleDoc and whether the last paragraph is empty
+    Only the startIndex and endIndex fields are requested.
+    :param doc_id: str GoogleDoc id
+    :param docs_service: GoogleDocsAPI service
+    :param creds: GoogleDocsAPI credentials
+    :return: int endIndex of last structural element, bool True if the last paragraph is only a newline
+    """
+    if docs_service is None:
+        if creds is None:
+            creds = signin()
+        docs_service = build('docs', 'v1', credentials=creds)
+
+    document = docs_service.documents().get(documentId=doc_id, fields='body.content(startIndex,endIndex)').execute()
+    last = document['body']['content'][-1]
+    return last['endIndex'], last['endIndex'] - last.get('startIndex', 0) <= 1
+
+
+def _structural_text(content):
+    """Return the text of a list of GoogleDoc structural elements, including table cells"""
+    text = ''
+    for element in content:
+        if 'paragraph' in element:
+            for run in element['paragraph'].get('elements', []):
+                text += run.get('textRun', {}).get('content', '')
+        elif 'table' in element:
+            for row in element['table'].get('tableRows', []):
+                for cell in row.get('tableCells', []):
+                    text += _structural_text(cell.get('content', []))
+    return text
+
+
+def get_document_text(doc_id, docs_service=None, creds=None):
+    """
+    Return the plain text of a GoogleDoc, requesting only the text fields
+    :param doc_id: str GoogleDoc id
+    :param docs_service: GoogleDocsAPI service
+    :param creds: GoogleDocsAPI credentials
+    :return: dict with fields 'documentId', 'title', 'revisionId', 'text'
+    """
+    if docs_service is None:
+        if creds is None:
+            creds = signin()
+        docs_service = build('docs', 'v1', credentials=creds)
+
+    text_fields = 'paragraph(elements(textRun(content)))'
+    fields = 'documentId,title,revisionId,body.content(%s,table(tableRows(tableCells(content(%s)))))' % (
+        text_fields, text_fields)
+    document = docs_service.documents().get(documentId=doc_id, fields=fields).execute()
+    return {
+        'documentId': document.get('documentId', doc_id),
+        'title': document.get('title', ''),
+        'revisionId': document.get('revisionId', ''),
+        'text': _structural_text(document.get('body', {}).get('content', [])),
+    }
+
+
+def drive_id_from_link(link):
+    """
+    Return the Drive FileID from a link, e.g. a webContentLink 'https://drive.google.com/uc?id=<id>&export=download'
+    :param link: str url
+    :return: str FileID or None
+    """
+    match = re.search(r'[?&]id=([\w-]+)|/d/([\w-]+)', link or '')
+    if match is None:
+        return None
+    return match.group(1) or match.group(2)
+
+
+def get_document_images(doc_id, docs_service=None, creds=None):
+    """
+    Return the inline images in a GoogleDoc
+    :param doc_id: str GoogleDoc id
+    :param docs_service: GoogleDocsAPI service
+    :param creds: GoogleDocsAPI credentials
+    :return: list of dicts with fields 'objectId', 'contentUri', 'sourceUri'
+    """
+    if docs_service is None:
+        if creds is None:
+            creds = signin()
+        docs_service = build('docs', 'v1', credentials=creds)
+
+    document = docs_service.documents().get(documentId=doc_id, fields='inlineObjects').execute()
+    return inline_images(document)
+
+
+def inline_images(document):
+    """
+    Return the inline images in a GoogleDoc resource
+    :param document: dict GoogleDoc resource, e.g. from documents().get(fields='inlineObjects')
+    :return: list of dicts with fields 'objectId', 'contentUri', 'sourceUri'
+    """
+    images = []
+    for object_id, inline_object in document.get('inlineObjects', {}).items():
+        properties = inline_object['inlineObjectProperties']['embeddedObject'].get('imageProperties', {})
+        images.append({
+            'objectId': object_id,
+            'contentUri': properties.get('contentUri', ''),
+            'sourceUri': properties.get('sourceUri', ''),
+        })
+    return images
+
+
+def get_document_stats(doc_id, docs_service=None, creds=None):
+    """
+    Return the size of a GoogleDoc, requesting only the endIndex and inline image fields
+    :param doc_id: str GoogleDoc id
+    :param docs_service: GoogleDocsAPI service
+    :param creds: GoogleDocsAPI credentials
+    :return: dict with fields 'end_index', 'n_images'
+    """
+    if docs_service is None:
+        if creds is None:
+            creds = signin()
+        docs_service = build('docs', 'v1', credentials=creds)
+
+    fields = 'body.content(endIndex,paragraph(elements(inlineObjectElement(inlineObjectId))))'
+    document = docs_service.documents().get(documentId=doc_id, fields=fields).execute()
+    content = document['body']['content']
+    n_images = sum(
+        1
+        for element in content
+        for run in element.get('paragraph', {}).get('elements', [])
+        if 'inlineObjectElement' in run
+    )
+    return {'end_index': content[-1]['endIndex'], 'n_images': n_images}
 
 
 def append_text(doc_id, text_to_append='', docs_service=None, creds=None):
@@ -314,11 +954,7 @@ def append_text(doc_id, text_to_append='', docs_service=None, creds=None):
         docs_service = build('docs', 'v1', credentials=creds)
 
     # Find the end of the file
-    document = docs_service.documents().get(documentId=doc_id).execute()
-    body = document['body']
-    content = body['content']
-    temp = content[len(content) - 1]
-    endIndex = temp['endIndex']
+    endIndex = get_document_end_index(doc_id, docs_service)
     print('end Index = %s' % endIndex)
 
     # Edit the document
@@ -337,7 +973,117 @@ def append_text(doc_id, text_to_append='', docs_service=None, creds=None):
     print("Append completed")
 
 
-def append_image(doc_id, image_loc='', folder_id=None, docs_service=None, creds=None):
+def _text_source_file(source):
+    """
+    Return binary file object and name for a filename or iterable of str/bytes, iterables are spooled to disk
+    A str is always a filename, so a mistyped filename is an error rather than text to append.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        if not os.path.isfile(source):
+            raise FileNotFoundError('Text file not found: %s' % source)
+        return open(source, 'rb'), os.path.basename(source)
+    if isinstance(source, (bytes, bytearray)):
+        raise TypeError('Text to append must be a filename or an iterable of str, e.g. [text]')
+    fh = tempfile.TemporaryFile()
+    for chunk in source:
+        fh.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+    fh.seek(0)
+    return fh, 'appended_text.txt'
+
+
+def append_text_stream(doc_id, source, chunk_size=TEXT_CHUNK_SIZE, batch_size=TEXT_BATCH_SIZE,
+                       attach_size=TEXT_ATTACH_SIZE, folder_id=None, drive_service=None, docs_service=None,
+                       creds=None):
+    """
+    Append large text to end of a GoogleDoc, reading it in chunks
+    Text is inserted using several insertText requests of at most chunk_size characters, sent in
+    batchUpdates of batch_size requests, so only one batch is held in memory. Text larger than
+    attach_size bytes is uploaded to Drive as a text file and a link to it is appended instead.
+    :param doc_id: str GoogleDoc id
+    :param source: str filename of an existing file, or iterable of str (e.g. open file, [text], generator of lines)
+    :param chunk_size: int maximum number of characters per insertText request
+    :param batch_size: int maximum number of insertText requests per batchUpdate
+    :param attach_size: int size in bytes above which the text is attached as a Drive file
+    :param folder_id: None or Drive folder to add attached files to
+    :param drive_service: GoogleDriveAPI service, used to upload attached files
+    :param docs_service: GoogleDocsAPI service
+    :param creds: GoogleDocsAPI credentials
+    :return: None
+    :raises FileNotFoundError: if source is a str that isn't an existing file
+    """
+
+    # Create Google Drive/Docs services, requiring google account credentials
+    if docs_service is None:
+        if creds is None:
+            creds = signin()
+        docs_service = build('docs', 'v1', credentials=creds)
+
+    fh, name = _text_source_file(source)
+    with fh:
+        fh.seek(0, os.SEEK_END)
+        size = fh.tell()
+        fh.seek(0)
+
+        if size > attach_size:
+            if drive_service is None:
+                if creds is None:
+                    creds = signin()
+                drive_service = build('drive', 'v3', credentials=creds)
+            from googleapiclient.http import MediaIoBaseUpload
+            file_metadata = {'name': name}
+            if folder_id:
+                file_metadata['parents'] = [folder_id]
+            media = MediaIoBaseUpload(fh, mimetype='text/plain', chunksize=UPLOAD_CHUNK_SIZE, resumable=True)
+            file = drive_service.files().create(body=file_metadata,
+                                                media_body=media,
+                                                fields='id, name, webContentLink, webViewLink',
+                                                supportsAllDrives=True).execute()
+            change_permission(file['id'], drive_service=drive_service)
+            print('Text file uploaded: %s' % name)
+
+            link_text = '%s (%.1f MB)' % (name, size / 1e6)
+            end_index = get_document_end_index(doc_id, docs_service) - 1
+            requests = [
+                {'insertText': {'location': {'index': end_index}, 'text': link_text + '\n'}},
+                {
+                    'updateTextStyle': {
+                        'range': {'startIndex': end_index, 'endIndex': end_index + utf16_len(link_text)},
+                        'textStyle': {'link': {'url': file['webViewLink']}},
+                        'fields': 'link',
+                    }
+                },
+            ]
+            docs_service.documents().batchUpdate(
+                documentId=doc_id, body={'requests': requests}).execute()
+            print('Link appended: %s' % file['webViewLink'])
+            return
+
+        text = io.TextIOWrapper(fh, encoding='utf-8', errors='replace')
+        index = get_document_end_index(doc_id, docs_service) - 1
+        requests = []
+        n_chars = 0
+        while True:
+            chunk = text.read(chunk_size)
+            if not chunk:
+                break
+            chunk = clean_text(chunk)
+            if not chunk:
+                continue
+            requests.append({'insertText': {'location': {'index': index}, 'text': chunk}})
+            index += utf16_len(chunk)
+            n_chars += len(chunk)
+            if len(requests) >= batch_size:
+                docs_service.documents().batchUpdate(
+                    documentId=doc_id, body={'requests': requests}).execute()
+                requests = []
+        if requests:
+            docs_service.documents().batchUpdate(
+                documentId=doc_id, body={'requests': requests}).execute()
+        text.detach()
+    print('Append completed: %d characters' % n_chars)
+
+
+def append_image(doc_id, image_loc='', folder_id=None, docs_service=None, creds=None, drive_service=None):
     """
     Append image to end of Goodle Doc
     :param doc_id: str GoogleDoc id
@@ -345,7 +1091,8 @@ def append_image(doc_id, image_loc='', folder_id=None, docs_service=None, creds=
     :param folder_id: None or Drive folder to add image to
     :param docs_service: GoogleDocsAPI service
     :param creds: GoogleDocsAPI credentials
-    :return: None
+    :param drive_service: GoogleDriveAPI service, used to upload local images
+    :return: str objectId of inserted image
     """
 
     # Create Google Drive/Docs services, requiring google account credentials
@@ -355,15 +1102,11 @@ def append_image(doc_id, image_loc='', folder_id=None, docs_service=None, creds=
         docs_service = build('docs', 'v1', credentials=creds)
 
     # Find the end of the file
-    document = docs_service.documents().get(documentId=doc_id).execute()
-    body = document['body']
-    content = body['content']
-    temp = content[len(content) - 1]
-    end_index = temp['endIndex']
+    end_index = get_document_end_index(doc_id, docs_service)
     print('end Index = %s' % end_index)
 
     if not image_loc.startswith('http'):
-        image_loc = upload_file(image_loc, folder_id, creds=creds)
+        image_loc = upload_file(image_loc, folder_id, drive_service=drive_service, creds=creds)
 
     print('\nappend image loc: %s\n' % image_loc)
     # Edit the document
@@ -385,6 +1128,36 @@ def append_image(doc_id, image_loc='', folder_id=None, docs_service=None, creds=
             }
         },
     ]
-    docs_service.documents().batchUpdate(
+    response = docs_service.documents().batchUpdate(
         documentId=doc_id, body={'requests': requests}).execute()
     print("Image appended!")
+    return response['replies'][1]['insertInlineImage']['objectId']
+
+
+def replace_image(doc_id, image_object_id, image_uri, docs_service=None, creds=None):
+    """
+    Replace an existing image in a GoogleDoc, keeping its position
+    :param doc_id: str GoogleDoc id
+    :param image_object_id: str objectId of image, as returned by append_image
+    :param image_uri: str http link to new image
+    :param docs_service: GoogleDocsAPI service
+    :param creds: GoogleDocsAPI credentials
+    :return: None
+    """
+
+    if docs_service is None:
+        if creds is None:
+            creds = signin()
+        docs_service = build('docs', 'v1', credentials=creds)
+
+    requests = [
+        {
+            'replaceImage': {
+                'imageObjectId': image_object_id,
+                'uri': image_uri,
+                'imageReplaceMethod': 'CENTER_CROP',
+            }
+        },
+    ]
+    docs_service.documents().batchUpdate(
+        documentId=doc_id, body={'requests': requests}).execute()
@@ -0,0 +1,222 @@
+"""
+Google Drive API
+Archive GoogleDocs in several formats, with their images, into a single compressed file
+
+Exports and image downloads run concurrently, each into memory, and are written straight into
+the archive as they complete. Identical images are only stored once, named by their checksum.
+
+Usage:
+    from google_drive_api.archive import create_archive
+    create_archive(gdrive, ['doc_id1', 'doc_id2'], 'mm12345-1_archive.tar.gz')
+
+By Dan Porter
+I16 Beamline Scientist
+Diamond Light Source Ltd
+2022
+"""
+
+import hashlib
+import io
+import json
+import tarfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import google_drive_api.api_functions as api
+
+EXPORT_FORMATS = {
+    'pdf': 'application/pdf',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'html': 'text/html',
+    'txt': 'text/plain',
+}
+IMAGE_SIGNATURES = {
+    b'\x89PNG': '.png',
+    b'\xff\xd8': '.jpg',
+    b'GIF8': '.gif',
+}
+# already compressed, stored without compression in zip files
+COMPRESSED_EXTENSIONS = ('.pdf', '.docx', '.png', '.jpg', '.gif')
+
+
+def _image_extension(data):
+    for signature, extension in IMAGE_SIGNATURES.items():
+        if data.startswith(signature):
+            return extension
+    return '.img'
+
+
+def _safe_name(name):
+    return name.replace('/', '_').replace('\\', '_').strip() or 'untitled'
+
+
+class ArchiveWriter:
+    """
+    Write files from memory to a tar or zip archive, the type is given by the filename extension
+    Supported: .zip, .tar, .tar.gz, .tgz, .tar.bz2, .tar.xz
+
+    :param filename: str archive filename
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        if filename.endswith('.zip'):
+            self.archive = zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED)
+        elif filename.endswith(('.tar.gz', '.tgz')):
+            self.archive = tarfile.open(filename, 'w:gz')
+        elif filename.endswith('.tar.bz2'):
+            self.archive = tarfile.open(filename, 'w:bz2')
+        elif filename.endswith('.tar.xz'):
+            self.archive = tarfile.open(filename, 'w:xz')
+        elif filename.endswith('.tar'):
+            self.archive = tarfile.open(filename, 'w')
+        else:
+            raise ValueError('Unknown archive type: %s' % filename)
+
+    def __repr__(self):
+        return "ArchiveWriter('%s')" % self.filename
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add(self, name, data):
+        """
+        Add a file to the archive
+        :param name: str name of file in archive
+        :param data: bytes file contents
+        """
+        if isinstance(self.archive, zipfile.ZipFile):
+            compress_type = zipfile.ZIP_STORED if name.endswith(COMPRESSED_EXTENSIONS) else zipfile.ZIP_DEFLATED
+            self.archive.writestr(name, data, compress_type=compress_type)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = time.time()
+            self.archive.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        self.archive.close()
+
+
+def create_archive(gdrive, doc_ids, archive_file, formats=('pdf', 'docx', 'html', 'txt'), include_images=True,
+                   max_workers=4, chunksize=api.DOWNLOAD_CHUNK_SIZE):
+    """
+    Export GoogleDocs in several formats, with their images, into a compressed archive
+    Archive contents:
+        <doc name>/<doc name>.pdf, .docx, .html, .txt
+        images/<sha256><ext>  - each unique image once
+        manifest.json  - documents, files, image checksums and any failed downloads
+    :param gdrive: GoogleDriveApi
+    :param doc_ids: list of str GoogleDoc ids
+    :param archive_file: str archive filename, e.g. 'archive.tar.gz' or 'archive.zip'
+    :param formats: list of export formats, keys of EXPORT_FORMATS
+    :param include_images: bool, if True, images in the documents are added
+    :param max_workers: int maximum number of concurrent downloads
+    :param chunksize: int bytes per download request
+    :return: dict manifest, manifest['failures'] lists any exports or images that could not be downloaded
+    """
+    drive_service = gdrive.drive_service
+    docs_service = gdrive.docs_service
+    files = gdrive.get_files(doc_ids, hydrate=True)
+    manifest = {'documents': [], 'images': {}, 'failures': []}
+    session = []  # AuthorizedSession for image content, created on first use
+
+    def export(file, fmt):
+        data = api.export_file(file.id, EXPORT_FORMATS[fmt], io.BytesIO(), chunksize, drive_service).getvalue()
+        name = _safe_name(file.name)
+        return 'export', (file, '%s/%s.%s' % (name, name, fmt), data)
+
+    def list_images(file):
+        return 'images', (file, api.get_document_images(file.id, docs_service))
+
+    def download_image(file, image):
+        drive_id = api.drive_id_from_link(image['sourceUri'])
+        data = None
+        if drive_id:
+            try:
+                data = api.download_file(drive_id, io.BytesIO(), chunksize, drive_service).getvalue()
+            except Exception as e:
+                print('Image source not available, using document copy: %s' % e)
+        if data is None:
+            # contentUri is readable with the document credentials
+            if not session:
+                from google.auth.transport.requests import AuthorizedSession
+                session.append(AuthorizedSession(gdrive.creds))
+            response = session[0].get(image['contentUri'], timeout=60)
+            if response.status_code != 200:
+                raise IOError('Image download failed (%s): %s' % (response.status_code, image['objectId']))
+            data = response.content
+        return 'image', (file, image, data)
+
+    source_documents = {}  # sourceUri: [doc ids], so each source image is only downloaded once
+    with ArchiveWriter(archive_file) as archive, ThreadPoolExecutor(max_workers) as executor:
+        tasks = {}  # future: description, for the manifest if the download fails
+        for file in files:
+            manifest['documents'].append({'id': file.id, 'name': file.name, 'link': file.link, 'files': []})
+            for fmt in formats:
+                tasks[executor.submit(export, file, fmt)] = {'document': file.id, 'format': fmt}
+            if include_images:
+                tasks[executor.submit(list_images, file)] = {'document': file.id, 'images': 'list'}
+        documents = {doc['id']: doc for doc in manifest['documents']}
+
+        pending = set(tasks)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    kind, result = future.result()
+                except Exception as e:
+                    failure = dict(tasks[future], error='%s: %s' % (type(e).__name__, e))
+                    # documents waiting on this image, a later document with the same source retries it
+                    waiting = source_documents.pop(failure.pop('sourceUri', None), None)
+                    if waiting:
+                        failure['also_used_by'] = waiting
+                    manifest['failures'].append(failure)
+                    print('Archive download failed: %s' % failure)
+                    continue
+                if kind == 'export':
+                    file, name, data = result
+                    archive.add(name, data)
+                    documents[file.id]['files'].append(name)
+                    print('Archived: %s (%d bytes)' % (name, len(data)))
+                elif kind == 'images':
+                    file, images = result
+                    for image in images:
+                        source = image['sourceUri']
+                        if source in source_documents:
+                            if file.id not in source_documents[source]:
+                                source_documents[source].append(file.id)
+                            continue
+                        if source:
+                            source_documents[source] = []
+                        future = executor.submit(download_image, file, image)
+                        tasks[future] = {'document': file.id, 'image': image['objectId'], 'sourceUri': source}
+                        pending.add(future)
+                else:
+                    file, image, data = result
+                    checksum = hashlib.sha256(data).hexdigest()
+                    if checksum not in manifest['images']:
+                        name = 'images/%s%s' % (checksum, _image_extension(data))
+                        archive.add(name, data)
+                        manifest['images'][checksum] = {'name': name, 'documents': []}
+                    image_documents = manifest['images'][checksum]['documents']
+                    # documents using the same source image, found while downloading
+                    waiting = source_documents.get(image['sourceUri'], [])
+                    for doc_id in [file.id] + waiting:
+                        if doc_id not in image_documents:
+                            image_documents.append(doc_id)
+                    if image['sourceUri']:
+                        # later documents with this source are added to the manifest directly
+                        source_documents[image['sourceUri']] = image_documents
+
+        archive.add('manifest.json', json.dumps(manifest, indent=2).encode())
+    print('Archive created: %s (%d documents, %d unique images)' % (
+        archive_file, len(files), len(manifest['images'])))
+    if manifest['failures']:
+        print('WARNING: %d downloads failed and are missing from the archive, see manifest.json' % (
+            len(manifest['failures'])))
+    return manifest
@@ -0,0 +1,298 @@
+"""
+Google Drive API
+Document entry builder - compile a formatted entry into a single batchUpdate
+
+Usage:
+    entry = gdrive.new_entry('doc_id')
+    entry.heading('Scan 12345', level=2)
+    entry.table([['energy', '8 keV'], ['temp', '300 K']], header=False)
+    entry.text('cmd: ', bold=True).text('scan eta 10 12 0.1 pil 1', font='Courier New').end_paragraph()
+    entry.image('scan_image.png', width=400)
+    entry.paragraph('Fit: centre = 11.02 +/- 0.01')
+    entry.write()
+
+All insertion indices are calculated locally from the end of the document, so writing the entry
+requires one read of the document end index and one batchUpdate.
+
+By Dan Porter
+I16 Beamline Scientist
+Diamond Light Source Ltd
+2022
+"""
+
+import google_drive_api.api_functions as api
+
+
+def text_style(bold=None, italic=None, underline=None, font=None, size=None, link=None):
+    """
+    Create a GoogleDocs TextStyle dict and fields mask
+    :param bold: None or bool
+    :param italic: None or bool
+    :param underline: None or bool
+    :param font: None or str font family, e.g. 'Courier New'
+    :param size: None or float font size in points
+    :param link: None or str url
+    :return: textStyle dict, str fields
+    """
+    style = {}
+    if bold is not None:
+        style['bold'] = bold
+    if italic is not None:
+        style['italic'] = italic
+    if underline is not None:
+        style['underline'] = underline
+    if font is not None:
+        style['weightedFontFamily'] = {'fontFamily': font}
+    if size is not None:
+        style['fontSize'] = {'magnitude': size, 'unit': 'PT'}
+    if link is not None:
+        style['link'] = {'url': link}
+    return style, ','.join(style.keys())
+
+
+def _merge_ranges(ranges):
+    """Merge adjacent (start, end, value) ranges with equal values"""
+    merged = []
+    for start, end, value in ranges:
+        if merged and merged[-1][1] == start and merged[-1][2] == value:
+            merged[-1] = (merged[-1][0], end, value)
+        else:
+            merged.append((start, end, value))
+    return merged
+
+
+class DocumentBuilder:
+    """
+    Build a formatted entry for a GoogleDoc and write it in one batchUpdate
+    Methods return the builder, so calls can be chained.
+
+    entry = DocumentBuilder('doc_id', docs_service, drive_service)
+    entry.heading('title').paragraph('some text').write()
+
+    :param doc_id: str GoogleDoc id
+    :param docs_service: GoogleDocsAPI service
+    :param drive_service: GoogleDriveAPI service, used to upload local images
+    :param image_folder_id: None or ID of Drive folder to add images to
+    """
+
+    def __init__(self, doc_id, docs_service=None, drive_service=None, image_folder_id=None):
+        self.doc_id = doc_id
+        self.docs_service = docs_service
+        self.drive_service = drive_service
+        self.image_folder_id = image_folder_id
+        self.items = []
+
+    def __repr__(self):
+        return "DocumentBuilder('%s', items=%d)" % (self.doc_id, len(self.items))
+
+    def text(self, text, bold=None, italic=None, underline=None, font=None, size=None, link=None):
+        """
+        Add a run of text to the current paragraph, with optional text style
+        :param text: str text to add (without newline)
+        :param bold: None or bool
+        :param italic: None or bool
+        :param underline: None or bool
+        :param font: None or str font family, e.g. 'Courier New'
+        :param size: None or float font size in points
+        :param link: None or str url
+        :return: self
+        """
+        style, fields = text_style(bold, italic, underline, font, size, link)
+        self.items.append(('text', api.clean_text(str(text)), (style, fields) if style else None))
+        return self
+
+    def end_paragraph(self, named_style='NORMAL_TEXT'):
+        """
+        End the current paragraph
+        :param named_style: str paragraph namedStyleType, e.g. 'NORMAL_TEXT', 'HEADING_1'
+        :return: self
+        """
+        self.items.append(('paragraph', named_style))
+        return self
+
+    def paragraph(self, text='', **style):
+        """
+        Add a paragraph of text
+        :param text: str text to add
+        :param style: text style options, see DocumentBuilder.text
+        :return: self
+        """
+        if text:
+            self.text(text, **style)
+        return self.end_paragraph('NORMAL_TEXT')
+
+    def heading(self, text, level=1):
+        """
+        Add a heading paragraph
+        :param text: str heading text
+        :param level: int heading level 1-6, or 0 for document title
+        :return: self
+        :raises ValueError: if level isn't 0-6
+        """
+        if level not in range(7):
+            raise ValueError('Heading level must be 0-6, not %r' % (level,))
+        self.text(text)
+        return self.end_paragraph('TITLE' if level == 0 else 'HEADING_%d' % level)
+
+    def table(self, rows, header=True):
+        """
+        Add a table
+        :param rows: list of lists of cell values
+        :param header: bool, if True, the first row is bold
+        :return: self
+        :raises ValueError: if the table has no rows or no columns
+        """
+        rows = [[api.clean_text(str(cell)) for cell in row] for row in rows]
+        if not rows or not max(len(row) for row in rows):
+            raise ValueError('Table must have at least one row and one column')
+        self.items.append(('table', rows, header))
+        return self
+
+    def image(self, image_loc, width=None, height=None):
+        """
+        Add an image in its own paragraph
+        :param image_loc: location of file, either local filename or http link
+        :param width: None or float width in points
+        :param height: None or float height in points
+        :return: self
+        """
+        self.items.append(('image', image_loc, width, height))
+        return self.end_paragraph('NORMAL_TEXT')
+
+    def build_requests(self, start_index, new_paragraph=False):
+        """
+        Compile the entry into a list of batchUpdate requests, inserting at start_index
+        Consecutive text is combined into single insertText requests, and adjacent paragraph and
+        text styles are combined into single style requests.
+        :param start_index: int document index to insert the entry at
+        :param new_paragraph: bool, if True, the entry starts with a newline, so the paragraph
+            containing start_index keeps its text and style
+        :return: list of request dicts
+        """
+        inserts = []
+        paragraph_styles = []
+        text_styles = []
+        buffer = []
+        buffer_start = start_index
+        paragraph_start = start_index
+        index = start_index
+        if new_paragraph:
+            buffer.append('\n')
+            index += 1
+            paragraph_start = index
+
+        def flush():
+            if buffer:
+                inserts.append({'insertText': {'location': {'index': buffer_start}, 'text': ''.join(buffer)}})
+                del buffer[:]
+            return index
+
+        items = list(self.items)
+        if items and items[-1][0] != 'paragraph':
+            items.append(('paragraph', 'NORMAL_TEXT'))
+
+        for item in items:
+            if item[0] == 'text':
+                _, text, style = item
+                length = api.utf16_len(text)
+                if style and length:
+                    text_styles.append((index, index + length, style))
+                buffer.append(text)
+                index += length
+            elif item[0] == 'paragraph':
+                buffer.append('\n')
+                index += 1
+                paragraph_styles.append((paragraph_start, index, item[1]))
+                paragraph_start = index
+            elif item[0] == 'image':
+                _, uri, width, height = item
+                buffer_start = flush()
+                request = {'location': {'index': index}, 'uri': uri}
+                size = {}
+                if width:
+                    size['width'] = {'magnitude': width, 'unit': 'PT'}
+                if height:
+                    size['height'] = {'magnitude': height, 'unit': 'PT'}
+                if size:
+                    request['objectSize'] = size
+                inserts.append({'insertInlineImage': request})
+                index += 1
+                buffer_start = index
+            elif item[0] == 'table':
+                _, rows, header = item
+                if paragraph_start != index:
+                    buffer.append('\n')
+                    index += 1
+                    paragraph_styles.append((paragraph_start, index, 'NORMAL_TEXT'))
+                flush()
+                n_rows = len(rows)
+                n_cols = max(len(row) for row in rows)
+                rows = [row + [''] * (n_cols - len(row)) for row in rows]
+                inserts.append({'insertTable': {'location': {'index': index}, 'rows': n_rows, 'columns': n_cols}})
+                # A newline is inserted before the table
+                paragraph_styles.append((index, index + 1, 'NORMAL_TEXT'))
+                table_start = index + 1
+                # Empty table: table start, then per row: row start + per cell: cell start + newline
+                cells = []
+                offset = 0
+                for n, row in enumerate(rows):
+                    for m, cell in enumerate(row):
+                        cell_index = table_start + 3 + n * (2 * n_cols + 1) + 2 * m
+                        cells.append((cell_index, cell_index + offset, cell))
+                        offset += api.utf16_len(cell)
+                # Fill cells from the end, so earlier indices are unchanged
+                for cell_index, _, cell in reversed(cells):
+                    if cell:
+                        inserts.append({'insertText': {'location': {'index': cell_index}, 'text': cell}})
+                if header:
+                    bold = text_style(bold=True)
+                    for _, final_index, cell in cells[:n_cols]:
+                        if cell:
+                            text_styles.append((final_index, final_index + api.utf16_len(cell), bold))
+                index = table_start + 1 + n_rows * (2 * n_cols + 1) + offset
+                buffer_start = paragraph_start = index
+        flush()
+
+        requests = inserts
+        for start, end, named_style in _merge_ranges(paragraph_styles):
+            requests.append({
+                'updateParagraphStyle': {
+                    'range': {'startIndex': start, 'endIndex': end},
+                    'paragraphStyle': {'namedStyleType': named_style},
+                    'fields': 'namedStyleType',
+                }
+            })
+        for start, end, (style, fields) in _merge_ranges(text_styles):
+            requests.append({
+                'updateTextStyle': {
+                    'range': {'startIndex': start, 'endIndex': end},
+                    'textStyle': style,
+                    'fields': fields,
+                }
+            })
+        return requests
+
+    def _upload_images(self):
+        """Replace local image filenames with uploaded links"""
+        for n, item in enumerate(self.items):
+            if item[0] == 'image' and not item[1].startswith('http'):
+                link = api.upload_file(item[1], self.image_folder_id, drive_service=self.drive_service)
+                self.items[n] = ('image', link) + item[2:]
+
+    def write(self):
+        """
+        Write the entry to the end of the document in a single batchUpdate
+        Local images are uploaded to Google Drive first. If the last paragraph of the document
+        isn't empty, the entry starts on a new paragraph.
+        :return: batchUpdate response dict
+        """
+        if not self.items:
+            return None
+        self._upload_images()
+        end_index, last_paragraph_empty = api.get_document_end(self.doc_id, self.docs_service)
+        requests = self.build_requests(end_index - 1, new_paragraph=not last_paragraph_empty)
+        response = self.docs_service.documents().batchUpdate(
+            documentId=self.doc_id, body={'requests': requests}).execute()
+        print('Entry written: %d requests' % len(requests))
+        self.items = []
+        return response
@@ -0,0 +1,131 @@
+"""
+Google Drive API
+Managed store of uploaded images, with one folder per visit
+
+Uploaded images are kept in a folder for each visit, optionally on a Shared Drive, instead of the
+root of My Drive, so searches for existing uploads only list the files of one visit. Visit folders
+are marked with a private application property, so they are found again by visit name.
+Images that no logbook references any more can be moved to the trash in bulk.
+
+Usage:
+    store = ImageStore(gdrive, root_folder_id='folder_id', drive_id='shared_drive_id')
+    folder_id = store.folder('mm12345-1')  # created on first use
+    link = store.upload('scan_image.png', folder_id)
+    store.prune(folder_id, ['logbook_id'], dry_run=True)  # list unreferenced images
+
+By Dan Porter
+I16 Beamline Scientist
+Diamond Light Source Ltd
+2022
+"""
+
+import datetime
+import threading
+
+import google_drive_api.api_functions as api
+
+STORE_PROPERTY = 'image_store'
+
+
+class ImageStore:
+    """
+    Per-visit image folders in Google Drive or a Shared Drive
+
+    :param gdrive: GoogleDriveApi
+    :param root_folder_id: None or id of folder containing the visit folders, None for the root of the drive
+    :param drive_id: None or id of Shared Drive, None for My Drive
+    """
+
+    def __init__(self, gdrive, root_folder_id=None, drive_id=None):
+        self.gdrive = gdrive
+        self.root_folder_id = root_folder_id
+        self.drive_id = drive_id
+        self._lock = threading.Lock()
+        self._folders = {}  # visit: folder_id
+
+    def __repr__(self):
+        return "ImageStore(root_folder_id=%r, drive_id=%r)" % (self.root_folder_id, self.drive_id)
+
+    def folder(self, visit):
+        """
+        Return the id of the image folder of a visit, creating the folder if it doesn't exist
+        :param visit: str visit name, e.g. 'mm12345-1'
+        :return: str folder id
+        """
+        with self._lock:
+            if visit in self._folders:
+                return self._folders[visit]
+            query = "appProperties has { key='%s' and value='%s' }" % (STORE_PROPERTY, api.escape_query(visit))
+            parent = self.root_folder_id or self.drive_id or 'root'
+            folders = list(self.gdrive.iter_files(folder_id=parent, mime_type=api.FOLDER_MIMETYPE, query=query,
+                                                  fields='id, name', max_results=1, drive_id=self.drive_id))
+            if folders:
+                folder_id = folders[0]['id']
+            else:
+                folder = api.create_folder('%s images' % visit, self.root_folder_id, self.drive_id,
+                                           app_properties={STORE_PROPERTY: visit},
+                                           drive_service=self.gdrive.drive_service)
+                folder_id = folder['id']
+            self._folders[visit] = folder_id
+        return folder_id
+
+    def upload(self, image_file, folder_id):
+        """
+        Upload an image to a visit folder, if an image with the same name is in the folder, return its link
+        :param image_file: str local filename
+        :param folder_id: str id of visit folder, see ImageStore.folder
+        :return: str webContentLink
+        """
+        return api.upload_file(image_file, folder_id, drive_service=self.gdrive.drive_service)
+
+    def images(self, folder_id, created_before=None):
+        """
+        Return the images in a visit folder
+        :param folder_id: str id of visit folder
+        :param created_before: None or datetime, only return images uploaded before this time (UTC)
+        :return: list of file dicts with fields 'id', 'name', 'createdTime'
+        """
+        query = "mimeType != '%s'" % api.FOLDER_MIMETYPE
+        if created_before is not None:
+            query += " and createdTime < '%s'" % created_before.strftime('%Y-%m-%dT%H:%M:%S')
+        files = self.gdrive.iter_files(folder_id=folder_id, query=query, fields='id, name, createdTime',
+                                       page_size=1000, drive_id=self.drive_id)
+        return list(files)
+
+    def referenced_ids(self, doc_ids):
+        """
+        Return the FileIDs of all images inserted in several GoogleDocs, using batch requests
+        :param doc_ids: list of str GoogleDoc ids
+        :return: set of str FileIDs
+        """
+        docs_service = self.gdrive.docs_service
+        requests = [docs_service.documents().get(documentId=doc_id, fields='inlineObjects') for doc_id in doc_ids]
+        file_ids = set()
+        for doc_id, (document, exception) in zip(doc_ids, api.batch_execute(requests, docs_service)):
+            if exception is not None:
+                raise IOError('Failed to read images of document %s: %s' % (doc_id, exception))
+            for image in api.inline_images(document):
+                file_id = api.drive_id_from_link(image['sourceUri'])
+                if file_id:
+                    file_ids.add(file_id)
+        return file_ids
+
+    def prune(self, folder_id, doc_ids, min_age=3600, dry_run=False):
+        """
+        Move images in a visit folder that none of the documents reference to the trash
+        Images uploaded in the last min_age seconds are kept, as they may not be inserted yet.
+        :param folder_id: str id of visit folder
+        :param doc_ids: list of str GoogleDoc ids, all documents that may use images in the folder
+        :param min_age: float minimum time in seconds since an image was uploaded
+        :param dry_run: bool, if True, nothing is trashed
+        :return: list of file dicts of unreferenced images
+        """
+        created_before = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=min_age)
+        images = self.images(folder_id, created_before)
+        referenced = self.referenced_ids(doc_ids)
+        unreferenced = [image for image in images if image['id'] not in referenced]
+        print('Image folder has %d images older than %ds, %d unreferenced' % (
+            len(images), min_age, len(unreferenced)))
+        if unreferenced and not dry_run:
+            api.trash_files([image['id'] for image in unreferenced], self.gdrive.drive_service)
+        return unreferenced
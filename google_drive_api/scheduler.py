@@ -0,0 +1,222 @@
+"""
+Google Drive API
+Priority scheduler for API operations
+
+Operations are run in lanes, each with its own pool of worker threads, so a small text append
+never waits behind a large image upload or a bulk export. Operations with the same key (e.g. a
+document ID) are run one at a time, in the order they are queued, whatever their lane.
+An operation can wait for another future (e.g. an image upload) before it is queued, so it doesn't
+hold up operations with the same key while it waits.
+
+Usage:
+    scheduler = OperationScheduler()
+    future = scheduler.submit(api.append_text, 'doc_id', 'beam lost', lane=INTERACTIVE, key='doc_id')
+    future.result()
+    print(scheduler.metrics())
+
+By Dan Porter
+I16 Beamline Scientist
+Diamond Light Source Ltd
+2022
+"""
+
+import collections
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows, FileLock only locks between threads
+
+INTERACTIVE = 'interactive'  # text appends and small edits
+IMAGES = 'images'  # image uploads
+BULK = 'bulk'  # exports and maintenance
+LANES = {INTERACTIVE: 4, IMAGES: 2, BULK: 1}  # maximum concurrent operations per lane
+
+
+class RateLimiter:
+    """
+    Limit the rate of operations across threads, e.g. to stay within an API quota
+
+    limiter = RateLimiter(60)  # 60 per minute
+    limiter.wait()  # blocks until the next operation is allowed
+
+    :param max_per_minute: float maximum number of operations per minute, None for no limit
+    """
+
+    def __init__(self, max_per_minute=60):
+        self.interval = 60.0 / max_per_minute if max_per_minute else 0
+        self._lock = threading.Lock()
+        self._next_time = 0
+
+    def __repr__(self):
+        return "RateLimiter(interval=%.3fs)" % self.interval
+
+    def wait(self):
+        """Wait until the next operation is allowed"""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_time)
+            self._next_time = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class FileLock:
+    """
+    Exclusive lock shared by all processes on this machine, using flock on a lock file
+
+    with FileLock('logbook.lock'):
+        ...  # only one process at a time
+
+    :param lock_file: str filename of lock file, created if it doesn't exist
+    """
+
+    def __init__(self, lock_file):
+        self.lock_file = lock_file
+        self._lock = threading.Lock()
+        self._file = None
+
+    def __repr__(self):
+        return "FileLock('%s')" % self.lock_file
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            self._file = open(self.lock_file, 'a')
+            if fcntl is not None:
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+        except BaseException:
+            self._lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+        finally:
+            self._file = None
+            self._lock.release()
+
+
+class OperationScheduler:
+    """
+    Run operations in priority lanes, each with a separate concurrency limit
+    Operations with the same key run one at a time, in the order they are queued.
+
+    :param lanes: None or dict of {lane: max_workers}, defaults to LANES
+    """
+
+    def __init__(self, lanes=None):
+        self.lanes = dict(LANES if lanes is None else lanes)
+        self._executors = {
+            lane: ThreadPoolExecutor(max_workers, thread_name_prefix='gdrive-%s' % lane)
+            for lane, max_workers in self.lanes.items()
+        }
+        self._lock = threading.Lock()
+        self._keys = {}  # key: deque of operations waiting for the previous operation with that key
+        self._queued = dict.fromkeys(self.lanes, 0)
+        self._running = dict.fromkeys(self.lanes, 0)
+        self._completed = dict.fromkeys(self.lanes, 0)
+
+    def __repr__(self):
+        return "OperationScheduler(%s)" % ', '.join('%s=%d' % (lane, n) for lane, n in self.lanes.items())
+
+    def submit(self, fn, *args, lane=INTERACTIVE, key=None, after=None, **kwargs):
+        """
+        Schedule fn(*args, **kwargs) to run in a lane
+        :param fn: function to run
+        :param lane: str lane name, INTERACTIVE, IMAGES or BULK
+        :param key: None or hashable, operations with the same key run one at a time in the order they are queued
+        :param after: None or Future, the operation is queued once this future is done, so operations with
+            the same key submitted in the meantime run first
+        :return: concurrent.futures.Future
+        """
+        if lane not in self._executors:
+            raise KeyError('Unknown lane: %s' % lane)
+        operation = (fn, args, kwargs, lane, key, Future())
+        with self._lock:
+            self._queued[lane] += 1
+        if after is None:
+            self._enqueue(operation)
+        else:
+            after.add_done_callback(lambda _: self._enqueue(operation))
+        return operation[-1]
+
+    def _enqueue(self, operation):
+        """Send operation to its lane, or to the back of its key queue if an operation with the key is running"""
+        key = operation[4]
+        with self._lock:
+            if key is not None:
+                if key in self._keys:
+                    self._keys[key].append(operation)
+                    return
+                self._keys[key] = collections.deque()
+        self._dispatch(operation)
+
+    def _dispatch(self, operation):
+        """Send operation to its lane"""
+        self._executors[operation[3]].submit(self._run, operation)
+
+    def _run(self, operation):
+        fn, args, kwargs, lane, key, future = operation
+        with self._lock:
+            self._queued[lane] -= 1
+            self._running[lane] += 1
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+        finally:
+            next_operation = None
+            with self._lock:
+                self._running[lane] -= 1
+                self._completed[lane] += 1
+                if key is not None:
+                    if self._keys[key]:
+                        next_operation = self._keys[key].popleft()
+                    else:
+                        del self._keys[key]
+            if next_operation is not None:
+                self._dispatch(next_operation)
+
+    def queue_depth(self, lane=None):
+        """
+        Return number of operations waiting to run
+        :param lane: None or str lane name, if None, the total of all lanes
+        :return: int
+        """
+        with self._lock:
+            if lane is None:
+                return sum(self._queued.values())
+            return self._queued[lane]
+
+    def metrics(self):
+        """
+        Return queue metrics for each lane
+        :return: dict of {lane: {'queued': int, 'running': int, 'completed': int, 'max_workers': int}}
+        """
+        with self._lock:
+            return {
+                lane: {
+                    'queued': self._queued[lane],
+                    'running': self._running[lane],
+                    'completed': self._completed[lane],
+                    'max_workers': max_workers,
+                }
+                for lane, max_workers in self.lanes.items()
+            }
+
+    def shutdown(self, wait=True):
+        """
+        Stop the worker threads
+        :param wait: bool, if True, wait for running operations to finish
+        """
+        for executor in self._executors.values():
+            executor.shutdown(wait=wait)
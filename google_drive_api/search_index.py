@@ -0,0 +1,197 @@
+"""
+Google Drive API
+Local full-text search index of GoogleDoc contents
+
+The text of each document is stored in a local SQLite FTS5 database. Documents are only
+re-downloaded when their Drive version has changed, and queries make no API calls.
+
+Usage:
+    from google_drive_api import GoogleDriveApi
+    from google_drive_api.search_index import LogbookIndex
+    index = LogbookIndex('logbook_index.db')
+    index.sync(['doc_id1', 'doc_id2'], GoogleDriveApi('credentials.json'))
+    for result in index.query('polarisation analyser'):
+        print(result['name'], result['link'], result['snippet'])
+
+By Dan Porter
+I16 Beamline Scientist
+Diamond Light Source Ltd
+2022
+"""
+
+import re
+import sqlite3
+
+import google_drive_api.api_functions as api
+
+DOC_LINK_REGEX = re.compile(r'docs\.google\.com/document/d/([\w-]+)')
+
+
+def fts_query(search):
+    """
+    Convert search terms to an FTS5 query, each term is quoted so punctuation is matched literally
+    e.g. "mm12345-1 12345.nxs" -> '"mm12345-1" "12345.nxs"', matching documents containing both terms
+    :param search: str search terms separated by spaces
+    :return: str FTS5 query
+    """
+    return ' '.join('"%s"' % term.replace('"', '""') for term in search.split())
+
+
+def find_document_ids(text):
+    """
+    Return list of GoogleDoc IDs from links in text, in order of appearance
+    :param text: str containing links like 'https://docs.google.com/document/d/<id>/edit'
+    :return: list of str
+    """
+    doc_ids = []
+    for doc_id in DOC_LINK_REGEX.findall(text):
+        if doc_id not in doc_ids:
+            doc_ids.append(doc_id)
+    return doc_ids
+
+
+class LogbookIndex:
+    """
+    Local full-text search index of GoogleDocs
+
+    index = LogbookIndex('logbook_index.db')
+    index.sync(doc_ids, gdrive)  # update changed documents
+    results = index.query('search terms')  # no API calls
+
+    :param db_file: str filename of SQLite database, created if it doesn't exist
+    """
+
+    def __init__(self, db_file='logbook_index.db'):
+        self.db_file = db_file
+        self.connection = sqlite3.connect(db_file)
+        self.connection.row_factory = sqlite3.Row
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS documents "
+                "(doc_id TEXT PRIMARY KEY, name TEXT, link TEXT, version TEXT, revision TEXT)"
+            )
+            self.connection.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS contents USING fts5(doc_id UNINDEXED, name, text)"
+            )
+
+    def __repr__(self):
+        return "LogbookIndex('%s')" % self.db_file
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def close(self):
+        """Close the database connection"""
+        self.connection.close()
+
+    def documents(self):
+        """
+        Return the indexed documents
+        :return: list of dicts with keys 'doc_id', 'name', 'link', 'version', 'revision'
+        """
+        rows = self.connection.execute("SELECT * FROM documents ORDER BY name")
+        return [dict(row) for row in rows]
+
+    def add_document(self, doc_id, name, link, text, version='', revision=''):
+        """
+        Add or replace a document in the index
+        :param doc_id: str GoogleDoc id
+        :param name: str document name
+        :param link: str document webViewLink
+        :param text: str document text
+        :param version: str Drive version of the document
+        :param revision: str GoogleDoc revisionId
+        """
+        with self.connection:
+            self.connection.execute("DELETE FROM contents WHERE doc_id = ?", (doc_id,))
+            self.connection.execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?)",
+                (doc_id, name, link, version, revision)
+            )
+            self.connection.execute(
+                "INSERT INTO contents (doc_id, name, text) VALUES (?, ?, ?)",
+                (doc_id, name, text)
+            )
+
+    def remove_document(self, doc_id):
+        """
+        Remove a document from the index
+        :param doc_id: str GoogleDoc id
+        """
+        with self.connection:
+            self.connection.execute("DELETE FROM contents WHERE doc_id = ?", (doc_id,))
+            self.connection.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+
+    def sync(self, doc_ids, gdrive):
+        """
+        Update the index with any documents that have changed since the last sync
+        The Drive versions of all documents are checked in a batch request, then the text is
+        downloaded only if the version is different from the indexed version.
+        Documents that have been deleted are removed from the index, other documents that can't be
+        read are skipped.
+        :param doc_ids: list of str GoogleDoc ids
+        :param gdrive: GoogleDriveApi
+        :return: list of updated doc_ids
+        """
+        indexed = {doc['doc_id']: doc['version'] for doc in self.documents()}
+        drive_service = gdrive.drive_service
+        requests = [
+            drive_service.files().get(fileId=doc_id, fields='id, name, version, webViewLink, trashed',
+                                      supportsAllDrives=True)
+            for doc_id in doc_ids
+        ]
+        updated = []
+        for doc_id, (metadata, exception) in zip(doc_ids, api.batch_execute(requests, drive_service)):
+            if exception is not None or metadata.get('trashed'):
+                status = getattr(getattr(exception, 'resp', None), 'status', None)
+                if (status == 404 or exception is None) and doc_id in indexed:
+                    self.remove_document(doc_id)
+                    print('Removed from index: %s' % doc_id)
+                else:
+                    print('Skipped %s: %s' % (doc_id, exception or 'trashed'))
+                continue
+            version = str(metadata.get('version', ''))
+            if indexed.get(doc_id) == version:
+                continue
+            try:
+                document = api.get_document_text(doc_id, gdrive.docs_service)
+            except Exception as e:
+                print('Skipped %s: %s' % (doc_id, e))
+                continue
+            self.add_document(
+                doc_id=doc_id,
+                name=metadata.get('name', document['title']),
+                link=metadata.get('webViewLink', ''),
+                text=document['text'],
+                version=version,
+                revision=document['revisionId'],
+            )
+            updated.append(doc_id)
+            print('Indexed: %s' % metadata.get('name', doc_id))
+        print('Search index updated: %d of %d documents changed' % (len(updated), len(doc_ids)))
+        return updated
+
+    def query(self, search, limit=20, snippet_tokens=16, fts_syntax=False):
+        """
+        Search the index, no API calls are made
+        :param search: str search terms, e.g. 'polarisation analyser', 'mm12345-1', '12345.nxs'
+        :param limit: int maximum number of results
+        :param snippet_tokens: int number of words in each snippet
+        :param fts_syntax: bool, if True, search is an FTS5 query, e.g. '"beam lost"', 'eta AND chi', 'pol*'
+        :return: list of dicts with keys 'doc_id', 'name', 'link', 'snippet', ordered by relevance
+        """
+        match = search if fts_syntax else fts_query(search)
+        if not match.strip():
+            return []
+        try:
+            rows = self.connection.execute(
+                "SELECT contents.doc_id, documents.name, documents.link, "
+                "snippet(contents, 2, '[', ']', '...', ?) AS snippet "
+                "FROM contents JOIN documents ON documents.doc_id = contents.doc_id "
+                "WHERE contents MATCH ? ORDER BY rank LIMIT ?",
+                (snippet_tokens, match, limit)
+            )
+            return [dict(row) for row in rows]
+        except sqlite3.OperationalError as e:
+            print('Invalid search %r: %s' % (search, e))
+            return []
@@ -0,0 +1,139 @@
+"""
+Google Drive API
+Pool of pre-copied template documents
+
+Copying a template and changing its permissions is slow, so a number of copies are made in
+advance and kept in a staging folder. Taking a document from the pool only requires a rename.
+Pool documents are marked with a private application property, so only pool copies of the
+template are ever taken. Visits may start in separate processes at the same time, so taking a
+copy, and trimming the pool after a refill, hold a lock file shared by all processes on the machine.
+Processes on different machines should use separate staging folders.
+
+Usage:
+    pool = TemplatePool(gdrive, 'template_id', 'staging_folder_id', size=5)
+    pool.refill()  # make copies up to the pool size
+    logbook = pool.take('mm12345-1 Logbook', 'visit_folder_id')  # GoogleDriveFile, or None if the pool is empty
+    pool.start_refill()  # replace the taken copy in a background thread
+
+By Dan Porter
+I16 Beamline Scientist
+Diamond Light Source Ltd
+2022
+"""
+
+import os
+import tempfile
+import threading
+
+import google_drive_api.api_functions as api
+from google_drive_api.scheduler import FileLock
+
+POOL_PROPERTY = 'template_pool'
+POOL_NAME = 'Template copy (pool)'
+
+
+class TemplatePool:
+    """
+    Pool of pre-copied, pre-shared template documents in a staging folder
+
+    :param gdrive: GoogleDriveApi
+    :param template_id: str FileID of template document
+    :param folder_id: str id of staging folder for pool copies
+    :param size: int number of copies to keep in the pool
+    :param can_edit: bool, if True, anyone can edit the copies, otherwise anyone can view
+    :param lock_file: None or str filename of lock file shared by all processes using the staging folder,
+        None for a file in the temporary directory
+    """
+
+    def __init__(self, gdrive, template_id, folder_id, size=5, can_edit=False, lock_file=None):
+        self.gdrive = gdrive
+        self.template_id = template_id
+        self.folder_id = folder_id
+        self.size = size
+        self.can_edit = can_edit
+        if lock_file is None:
+            lock_file = os.path.join(tempfile.gettempdir(), 'template_pool_%s.lock' % folder_id)
+        self.file_lock = FileLock(lock_file)
+        self._lock = threading.Lock()
+        self._refill_thread = None
+
+    def __repr__(self):
+        return "TemplatePool('%s', '%s', size=%d)" % (self.template_id, self.folder_id, self.size)
+
+    def __len__(self):
+        return len(self.available())
+
+    def available(self):
+        """
+        Return the pool copies currently in the staging folder
+        :return: list of file dicts with fields 'id', 'name', 'webViewLink'
+        """
+        query = "appProperties has { key='%s' and value='%s' }" % (POOL_PROPERTY, self.template_id)
+        files = self.gdrive.iter_files(folder_id=self.folder_id, query=query, fields='id, name, webViewLink')
+        return list(files)
+
+    def refill(self):
+        """
+        Copy the template until the pool is full, each copy has its permissions changed
+        Other processes may refill the pool at the same time, so after copying, the pool is
+        listed again and any of this refill's copies beyond the pool size (in FileID order) are
+        moved to the trash. Every refill agrees on the order, so the pool is neither over- nor under-filled.
+        The pool is trimmed holding the lock file, so a copy being taken is never trashed.
+        :return: int number of copies added to the pool
+        """
+        with self._lock:
+            n_copies = self.size - len(self.available())
+            copied = []
+            for n in range(n_copies):
+                copy = self.gdrive.copy_file(
+                    self.template_id,
+                    POOL_NAME,
+                    folder_id=self.folder_id,
+                    app_properties={POOL_PROPERTY: self.template_id},
+                )
+                copy.change_permission(self.can_edit)
+                copied.append(copy.id)
+            if copied:
+                with self.file_lock:
+                    pool_ids = sorted(file['id'] for file in self.available())
+                    surplus = [file_id for file_id in pool_ids[self.size:] if file_id in copied]
+                    if surplus:
+                        api.trash_files(surplus, self.gdrive.drive_service)
+                copied = [file_id for file_id in copied if file_id not in surplus]
+        print('Template pool refilled with %d copies' % len(copied))
+        return len(copied)
+
+    def start_refill(self):
+        """
+        Refill the pool in a background thread
+        The thread is not a daemon, so the program waits for the refill to finish before exiting.
+        :return: threading.Thread
+        """
+        if self._refill_thread is None or not self._refill_thread.is_alive():
+            self._refill_thread = threading.Thread(target=self.refill, name='TemplatePoolRefill')
+            self._refill_thread.start()
+        return self._refill_thread
+
+    def take(self, new_file_name, folder_id=None):
+        """
+        Take a copy from the pool, renaming it and removing it from the pool
+        The lock file is held while the pool is listed and the copy renamed, so processes
+        taking from the pool at the same time never take the same copy.
+        :param new_file_name: str new file name
+        :param folder_id: None or str id of folder to move the file to, otherwise it stays in the staging folder
+        :return: GoogleDriveFile, or None if the pool is empty
+        """
+        with self.file_lock:
+            available = self.available()
+            if not available:
+                print('Template pool is empty')
+                return None
+            file = self.gdrive.update_file(
+                available[0]['id'],
+                name=new_file_name,
+                add_parents=folder_id,
+                remove_parents=self.folder_id if folder_id else None,
+                app_properties={POOL_PROPERTY: None},
+            )
+        print('Taken from template pool: %s' % new_file_name)
+        return file
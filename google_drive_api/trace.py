@@ -0,0 +1,304 @@
+"""
+Google Drive API
+Record and replay traces of API requests
+
+TracingHttp wraps the HTTP transport used by the services and records every request, with
+timestamps, sizes, status codes, latency and redacted bodies, to a gzipped JSON-lines file.
+Redaction replaces every string value with 'x' of the same length, so the structure and size
+of each request is kept without any logbook text, names, emails or tokens.
+
+replay_trace re-runs a trace against StubHttp, a transport that waits for the recorded latency
+and returns a response of the recorded size, at the original or a compressed timescale. This
+measures the client-side overhead of a real session without making any API calls.
+
+Usage:
+    gdrive = GoogleDriveApi('credentials.json', trace_file='session_trace.jsonl.gz')
+    gdrive.append_text('doc_id', 'beam lost')
+    ...
+    from google_drive_api.trace import replay_trace
+    replay_trace('session_trace.jsonl.gz', speed=10)
+
+By Dan Porter
+I16 Beamline Scientist
+Diamond Light Source Ltd
+2022
+"""
+
+import atexit
+import gzip
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+TRACE_VERSION = 1
+# query parameters that describe the request, not the user's data
+SAFE_QUERY_KEYS = ('alt', 'fields', 'pageSize', 'uploadType', 'mimeType', 'supportsAllDrives',
+                   'includeItemsFromAllDrives', 'corpora', 'sendNotificationEmail', 'prettyPrint')
+ID_REGEX = re.compile(r'^[\w-]{20,}$')  # Drive file, folder and document IDs
+
+
+def redact(value):
+    """
+    Replace every string in a JSON value with 'x' of the same length, keeping the structure
+    :param value: JSON compatible value (dict, list, str, number)
+    :return: redacted value
+    """
+    if isinstance(value, str):
+        return 'x' * len(value)
+    if isinstance(value, dict):
+        return {key: redact(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [redact(item) for item in value]
+    return value
+
+
+def redact_body(body):
+    """
+    Redact a request or response body
+    :param body: None, str or bytes
+    :return: redacted JSON value, or None if the body is empty or not JSON (e.g. file contents)
+    """
+    if not body:
+        return None
+    try:
+        return redact(json.loads(body))
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _redact_segment(segment):
+    """Redact a path segment that is an ID, keeping any ':method' suffix, e.g. '<doc id>:batchUpdate'"""
+    name, colon, method = segment.partition(':')
+    if ID_REGEX.match(name):
+        return 'x' * len(name) + colon + method
+    return segment
+
+
+def redact_uri(uri):
+    """
+    Redact IDs in the path, including '/documents/<id>:batchUpdate', and query values, except SAFE_QUERY_KEYS
+    :param uri: str url
+    :return: str url
+    """
+    parts = urlsplit(uri)
+    path = '/'.join(_redact_segment(segment) for segment in parts.path.split('/'))
+    query = urlencode([
+        (key, item if key in SAFE_QUERY_KEYS else 'x' * len(item))
+        for key, item in parse_qsl(parts.query, keep_blank_values=True)
+    ])
+    return urlunsplit((parts.scheme, parts.netloc, path, query, ''))
+
+
+def _size(body):
+    if body is None:
+        return 0
+    if isinstance(body, str):
+        return len(body.encode('utf-8'))
+    if isinstance(body, (bytes, bytearray)):
+        return len(body)
+    return 0  # file-like upload bodies are not read
+
+
+def read_trace(trace_file):
+    """
+    Read the request records from a trace file
+    :param trace_file: str filename of gzipped JSON-lines trace
+    :return: list of dicts, one per request, in order of start time
+    """
+    with gzip.open(trace_file, 'rt') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return sorted((record for record in records if 'method' in record), key=lambda record: record['start'])
+
+
+class TracingHttp:
+    """
+    Wrap an HTTP transport (httplib2.Http, AuthorizedHttp or PooledHttp) and record each request
+    The trace file is closed when the program exits, or by TracingHttp.close().
+
+    :param http: transport with the httplib2 request interface
+    :param trace_file: str filename of gzipped JSON-lines trace, e.g. 'trace.jsonl.gz'
+    """
+
+    def __init__(self, http, trace_file):
+        self.http = http
+        self.trace_file = trace_file
+        self._lock = threading.Lock()
+        self._file = gzip.open(trace_file, 'wt')
+        self._t0 = time.monotonic()
+        self._write({'trace': TRACE_VERSION, 'created': time.time()})
+        atexit.register(self.close)
+
+    def __repr__(self):
+        return "TracingHttp(%r, '%s')" % (self.http, self.trace_file)
+
+    def __getattr__(self, name):
+        # e.g. credentials, timeout, redirect_codes used by googleapiclient
+        return getattr(self.http, name)
+
+    def _write(self, record):
+        line = json.dumps(record, separators=(',', ':'))
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line + '\n')
+
+    def request(self, uri, method='GET', body=None, headers=None, *args, **kwargs):
+        """
+        Make an HTTP request with the wrapped transport and record it
+        :return: httplib2.Response, bytes content
+        """
+        start = time.monotonic()
+        record = {
+            'start': round(start - self._t0, 6),
+            'thread': threading.current_thread().name,
+            'method': method,
+            'uri': redact_uri(uri),
+            'request_bytes': _size(body),
+            'request_body': redact_body(body) if isinstance(body, (str, bytes)) else None,
+        }
+        try:
+            response, content = self.http.request(uri, method, body, headers, *args, **kwargs)
+        except Exception as e:
+            record.update(latency=round(time.monotonic() - start, 6), status=None, error=type(e).__name__)
+            self._write(record)
+            raise
+        record.update(
+            latency=round(time.monotonic() - start, 6),
+            status=response.status,
+            content_type=response.get('content-type', ''),
+            response_bytes=_size(content),
+            response_body=redact_body(content),
+        )
+        self._write(record)
+        return response, content
+
+    def close(self):
+        """Close the trace file and the wrapped transport"""
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.close()
+            self._file = None
+        if hasattr(self.http, 'close'):
+            self.http.close()
+
+
+class StubHttp:
+    """
+    Transport returning recorded responses, after the recorded latency
+    Responses are matched to requests by method and redacted uri, in recorded order.
+
+    :param records: list of trace records, see read_trace
+    :param speed: float timescale, e.g. 10 waits for a tenth of the recorded latency
+    """
+
+    def __init__(self, records, speed=1.0):
+        self.speed = speed
+        self._lock = threading.Lock()
+        self._responses = {}
+        for record in records:
+            self._responses.setdefault((record['method'], record['uri']), []).append(record)
+
+    def __repr__(self):
+        return "StubHttp(speed=%s)" % self.speed
+
+    def request(self, uri, method='GET', body=None, headers=None, *args, **kwargs):
+        """
+        Return the next recorded response for this request
+        :return: httplib2.Response, bytes content
+        """
+        import httplib2
+        with self._lock:
+            records = self._responses.get((method, redact_uri(uri)))
+            if not records:
+                raise KeyError('Request not in trace: %s %s' % (method, uri))
+            record = records.pop(0) if len(records) > 1 else records[0]
+        time.sleep(record['latency'] / self.speed)
+        if record['status'] is None:
+            raise ConnectionError('Recorded error: %s' % record.get('error'))
+        if record.get('response_body') is not None:
+            content = json.dumps(record['response_body']).encode('utf-8')
+        else:
+            content = b'\0' * record.get('response_bytes', 0)
+        info = {'status': record['status'], 'content-type': record.get('content_type', '')}
+        return httplib2.Response(info), content
+
+
+def _media_response(response, content):
+    """HttpRequest postproc for media downloads, which aren't deserialised"""
+    return content
+
+
+def replay_trace(trace_file, speed=1.0, max_workers=10, http=None):
+    """
+    Re-run the requests in a trace at the original or a compressed timescale
+    Each request is started at its recorded time (divided by speed) and executed as a
+    googleapiclient HttpRequest, which deserialises the response, so the time beyond the stub
+    latency is the client-side overhead.
+    :param trace_file: str filename of gzipped JSON-lines trace
+    :param speed: float timescale, 1 for the original timing, 10 to run 10x faster
+    :param max_workers: int maximum number of concurrent requests
+    :param http: None or transport to replay against, default StubHttp
+    :return: dict of replay statistics
+    """
+    from googleapiclient.errors import HttpError
+    from googleapiclient.http import HttpRequest
+    from googleapiclient.model import JsonModel
+
+    records = read_trace(trace_file)
+    if http is None:
+        http = StubHttp(records, speed)
+    model = JsonModel()
+    results = []
+    t0 = time.monotonic()
+
+    def replay(record):
+        scheduled = record['start'] / speed
+        delay = scheduled - (time.monotonic() - t0)
+        if delay > 0:
+            time.sleep(delay)
+        started = time.monotonic() - t0
+        headers = {}
+        body = None
+        if record['request_body'] is not None:
+            body = json.dumps(record['request_body'])
+            headers['content-type'] = 'application/json'
+        if record.get('content_type', '').startswith('application/json'):
+            postproc = model.response
+        else:
+            postproc = _media_response
+        request = HttpRequest(http, postproc, record['uri'], method=record['method'], body=body, headers=headers)
+        try:
+            request.execute()
+            error = None
+        except (HttpError, ConnectionError, KeyError) as e:
+            error = type(e).__name__
+        elapsed = time.monotonic() - t0 - started
+        results.append({
+            'lag': started - scheduled,
+            'elapsed': elapsed,
+            'overhead': elapsed - record['latency'] / speed,
+            'error': error,
+        })
+
+    with ThreadPoolExecutor(max_workers) as executor:
+        list(executor.map(replay, records))
+    duration = time.monotonic() - t0
+
+    n = len(results) or 1
+    stats = {
+        'requests': len(results),
+        'errors': sum(1 for result in results if result['error']),
+        'recorded_duration': max((r['start'] + r['latency'] for r in records), default=0),
+        'replay_duration': duration,
+        'mean_overhead': sum(result['overhead'] for result in results) / n,
+        'max_overhead': max((result['overhead'] for result in results), default=0),
+        'max_lag': max((result['lag'] for result in results), default=0),
+    }
+    print('Replayed %d requests (%d errors) in %.3f s, recorded %.3f s at speed %s' % (
+        stats['requests'], stats['errors'], duration, stats['recorded_duration'], speed))
+    print('Client overhead per request: mean %.2f ms, max %.2f ms; max start lag %.2f ms' % (
+        1000 * stats['mean_overhead'], 1000 * stats['max_overhead'], 1000 * stats['max_lag']))
+    return stats
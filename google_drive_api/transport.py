@@ -0,0 +1,108 @@
+"""
+Google Drive API
+Thread-safe, connection-pooled HTTP transport
+
+googleapiclient uses httplib2 by default, which is not thread-safe and doesn't pool connections.
+PooledHttp provides the httplib2 request interface used by googleapiclient on top of a
+requests Session with a pool of keep-alive connections, so services built with it can be
+shared between threads.
+
+Usage:
+    http = PooledHttp(creds, pool_size=10, timeout=60)
+    drive_service = build('drive', 'v3', http=http)
+
+By Dan Porter
+I16 Beamline Scientist
+Diamond Light Source Ltd
+2022
+"""
+
+import socket
+import threading
+
+import httplib2
+import requests
+from requests.adapters import HTTPAdapter
+from google.auth.transport.requests import Request
+
+REFRESH_STATUS_CODES = (401,)
+
+
+class PooledHttp:
+    """
+    Thread-safe HTTP transport for googleapiclient, using a pool of keep-alive connections
+    Credentials are applied to each request and refreshed when they expire.
+
+    :param creds: google.auth credentials
+    :param pool_size: int maximum number of open connections per host, threads wait for a free connection
+    :param timeout: float or (connect, read) tuple, request timeout in seconds
+    """
+
+    def __init__(self, creds, pool_size=10, timeout=60):
+        self.creds = creds
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._auth_request = Request(self.session)
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "PooledHttp(pool_size=%s, timeout=%s)" % (self.pool_size, self.timeout)
+
+    def _apply_credentials(self, headers, refresh=False):
+        """Add authorization header, refreshing credentials if required"""
+        if self.creds is None:
+            return
+        with self._lock:
+            if refresh or not self.creds.valid:
+                self.creds.refresh(self._auth_request)
+            self.creds.apply(headers)
+
+    def _send(self, uri, method, body, headers, redirections):
+        try:
+            return self.session.request(
+                method, uri,
+                data=body,
+                headers=headers,
+                timeout=self.timeout,
+                allow_redirects=redirections > 0,
+            )
+        except requests.exceptions.Timeout as e:
+            # googleapiclient retries socket.timeout and ConnectionError
+            raise socket.timeout(str(e))
+        except requests.exceptions.ConnectionError as e:
+            raise ConnectionError(str(e))
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5, connection_type=None):
+        """
+        Make an HTTP request, with the same interface as httplib2.Http.request
+        :param uri: str url
+        :param method: str HTTP method
+        :param body: None, str or bytes request body
+        :param headers: None or dict of request headers
+        :param redirections: int, if 0 redirects are not followed
+        :param connection_type: unused, for compatibility with httplib2
+        :return: httplib2.Response, bytes content
+        """
+        headers = dict(headers or {})
+        self._apply_credentials(headers)
+        response = self._send(uri, method, body, headers, redirections)
+        if response.status_code in REFRESH_STATUS_CODES and self.creds is not None:
+            self._apply_credentials(headers, refresh=True)
+            response = self._send(uri, method, body, headers, redirections)
+
+        info = {key.lower(): value for key, value in response.headers.items()}
+        if 'content-encoding' in info:
+            # requests has decompressed the content, as httplib2 does, so the headers must match it
+            info['-content-encoding'] = info.pop('content-encoding')
+            info['content-length'] = str(len(response.content))
+        info['status'] = response.status_code
+        info['reason'] = response.reason
+        return httplib2.Response(info), response.content
+
+    def close(self):
+        """Close all pooled connections"""
+        self.session.close()
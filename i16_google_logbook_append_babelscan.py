@@ -29,28 +29,39 @@ import babelscan
 CONFIG = '/dls_sw/i16/software/python/babelscan/config_files/i16.config'
 IMAGE_LOC = 'scan_image.png'
 
+
+def append_scan(exppar_file, scan_file, fit=False):
+    """
+    Load a scan using Babelscan, save a plot and append it to the logbook
+    :param exppar_file: str filepath of experimental parameters json file
+    :param scan_file: str scan number or filename
+    :param fit: bool, if True, fit the default axes and plot the fit
+    :return: None
+    """
+    if CONFIG:
+        i16 = babelscan.instrument_from_config(CONFIG)
+        scan = i16.scan(scan_file)
+    else:
+        scan = babelscan.file_loader(scan_file)
+    print(scan)
+    if fit:
+        print('Fitting default axes')
+        scan.fit()
+        print('Creating plot')
+        fig = scan.plot.detail(yaxis=['signal', 'fit'])
+    else:
+        print('Creating plot')
+        fig = scan.plot.scananddetector()
+    fig.savefig(IMAGE_LOC)
+    append_image(exppar_file, IMAGE_LOC)
+
+
 if __name__ == '__main__':
     # --- Command line usage ---
     exppar_file = sys.argv[1]
     scan_file = sys.argv[2]
     if exppar_file.endswith('.json'):
-        if CONFIG:
-            i16 = babelscan.instrument_from_config(CONFIG)
-            scan = i16.scan(scan_file)
-        else:
-            scan = babelscan.file_loader(scan_file)
-        print(scan)
-        if sys.argv[-1] == 'fit':
-            print('Fitting default axes')
-            scan.fit()
-            print('Creating plot')
-            fig = scan.plot.detail(yaxis=['signal', 'fit'])
-        else:
-            print('Creating plot')
-            fig = scan.plot.scananddetector()
-        fig.savefig(IMAGE_LOC)
-        append_image(exppar_file, IMAGE_LOC)
+        append_scan(exppar_file, scan_file, sys.argv[-1] == 'fit')
     else:
         print('You must enter an experimental parameter file, for example:')
         print(' python i16_google_logbook_append_text.py /dls_sw/i16/scripts/2022/mm12345-1/mm12345-1.json \'file.nxs\'')
-
@@ -16,14 +16,30 @@ import json
 import os
 
 from google_drive_api import GoogleDriveApi
+from google_drive_api.api_functions import DOWNLOAD_CHUNK_SIZE
+from google_drive_api.image_store import ImageStore
+from google_drive_api.scheduler import FileLock
+from google_drive_api.search_index import LogbookIndex, find_document_ids
+from google_drive_api.template_pool import TemplatePool
 
 # Edit these:
 CREDS_JSON = 'i16_user_google_creds.json'  # Credentials file
 TEMPLATE = '1fF1CU3UJq_qlqn43D9AWLovTr1sLK8HuOK9AIWk_HRI'  # GoogleAPI_ExampleLogbook
 LOGBOOK_LIST = '1VumxVxyzXFuLOMsIIPvUYUEhgIOQo_aiKFhVSYucO0Y'  # I16 Logbook List
+TEMPLATE_POOL_FOLDER = ''  # Drive folder of pre-copied templates, '' to copy the template on demand
+TEMPLATE_POOL_SIZE = 5  # number of pre-copied templates to keep
+TEMPLATE_POOL_LOCK = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'template_pool.lock')
+IMAGE_STORE_FOLDER = ''  # Drive folder for the image folder of each visit, '' for the root of the drive
+IMAGE_STORE_DRIVE = ''  # Shared Drive ID for image folders, '' for My Drive
+LOGBOOK_MAX_LENGTH = 1000000  # document length (end index) above which a new logbook volume is started
+LOGBOOK_MAX_IMAGES = 200  # number of images above which a new logbook volume is started
+SEARCH_INDEX = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logbook_index.db')  # local search index
+TRACE_FILE = os.environ.get('I16_LOGBOOK_TRACE')  # record API requests to this file, e.g. 'trace.jsonl.gz'
 
-# Sign-in to GoogleDriveAPI
-gdrive = GoogleDriveApi(CREDS_JSON)
+# GoogleDriveAPI, sign-in happens when the API is first used
+gdrive = GoogleDriveApi(CREDS_JSON, trace_file=TRACE_FILE)
+_template_pool = None
+_template_folder = None
 
 
 def read_exppars(filename='mm12345-1.json'):
@@ -41,13 +57,90 @@ def write_exppars(exppars):
     print('Saved experiment parameter file to: %s' % filename)
 
 
+def get_template_pool():
+    """Return TemplatePool of pre-copied templates, or None if TEMPLATE_POOL_FOLDER isn't set"""
+    global _template_pool
+    if not TEMPLATE_POOL_FOLDER:
+        return None
+    if _template_pool is None:
+        _template_pool = TemplatePool(gdrive, TEMPLATE, TEMPLATE_POOL_FOLDER, TEMPLATE_POOL_SIZE,
+                                      lock_file=TEMPLATE_POOL_LOCK)
+    return _template_pool
+
+
+def template_folder():
+    """Return id of the folder containing the template, where copies of the template are put"""
+    global _template_folder
+    if _template_folder is None:
+        _template_folder = gdrive.get_metadata(TEMPLATE, 'parents')['parents'][0]
+    return _template_folder
+
+
+def refill_template_pool():
+    """
+    Use Google Drive API to:
+        - copy the template into the staging folder until the pool is full
+    :return: None
+    """
+    pool = get_template_pool()
+    if pool is None:
+        print('TEMPLATE_POOL_FOLDER is not set')
+        return
+    pool.refill()
+
+
+def get_image_store():
+    """Return ImageStore of per-visit image folders"""
+    return ImageStore(gdrive, IMAGE_STORE_FOLDER or None, IMAGE_STORE_DRIVE or None)
+
+
+def image_folder(exppars):
+    """
+    Return the id of the image folder of a visit, creating it on first use
+    The folder id is saved in exppars['image_folder_id'] and the new folder is shared with the user emails.
+    :param exppars: dict experimental parameters
+    :return: str folder id
+    """
+    if not exppars.get('image_folder_id'):
+        exppars['image_folder_id'] = get_image_store().folder(exppars['logbook_name'])
+        write_exppars(exppars)
+        emails = list(exppars.get('user_emails', {}).values())
+        if emails and gdrive.share([exppars['image_folder_id']], emails) < len(emails):
+            print('WARNING: image folder is not shared with every user, run: logbook.py share %s' % (
+                exppars.get('experiment_parameters', '<exppars file>')))
+    return exppars['image_folder_id']
+
+
+def prune_images(exp_pars_file='mm12345-1.json', min_age=3600, dry_run=False):
+    """
+    Use Google Drive API to:
+        - move images in the visit image folder that no logbook volume uses to the trash
+    :param exp_pars_file: str filepath of experimental parameters json file
+    :param min_age: float minimum time in seconds since an image was uploaded
+    :param dry_run: bool, if True, unreferenced images are listed but not trashed
+    :return: list of file dicts of unreferenced images
+    """
+    exppars = read_exppars(exp_pars_file)
+
+    if not exppars['logbook_id'] or not exppars.get('image_folder_id'):
+        print('No logbook image folder')
+        return []
+
+    doc_ids = [volume['id'] for volume in logbook_volumes(exppars)]
+    unreferenced = get_image_store().prune(exppars['image_folder_id'], doc_ids, min_age, dry_run)
+    for image in unreferenced:
+        print('  %s (%s)' % (image['name'], image['createdTime']))
+    return unreferenced
+
+
 def create_new_logbook(exp_pars_file='mm12345-1.json'):
     """
     Use Google Drive API to:
-        - Create new Google Docs logbook from template
+        - Create new Google Docs logbook from template, taken from the template pool if available
         - Change permissions and create sharable link
         - update experimental parameters json file with sharable link
         - Merge experimental parameters from json file with template
+        - Share the logbook with the user emails
         - Update Logbook list file with new file and link
     :param exp_pars_file: str filepath of experimental parameters json file
     :return: None
@@ -60,10 +153,8 @@ def create_new_logbook(exp_pars_file='mm12345-1.json'):
         return
 
     # --- New Logbook ---
-    logbook = gdrive.copy_file(TEMPLATE, exppars['logbook_name'])
-
-    # Change permission of copied file
-    logbook.change_permission()
+    pool = get_template_pool()
+    logbook = _copy_template(exppars['logbook_name'], pool)
     exppars['logbook_id'] = logbook.id
     exppars['logbook_link'] = logbook.link
     exppars['replace_fields']['{{logbook_link}}'] = logbook.link
@@ -75,16 +166,152 @@ def create_new_logbook(exp_pars_file='mm12345-1.json'):
     # Merge new logbook with replacement fields
     logbook.merge(exppars['replace_fields'])
 
+    # Share with users
+    shared = share_logbook(exppars)
+
     # --- Update Experiment list Doc ---
-    newtxt = '%s %s\n{{new_logbook}}' % (exppars['logbook_name'], logbook.link)
+    _add_to_logbook_list(exppars['logbook_name'], logbook.link)
+    print("finished!" if shared else "finished, but the logbook is not shared with every user!")
+
+    # --- Replace the pool copy in the background ---
+    if pool:
+        pool.start_refill()
+
+
+def _copy_template(logbook_name, pool=None):
+    """Return GoogleDriveFile of new logbook, taken from the template pool or copied from the template"""
+    logbook = pool.take(logbook_name, template_folder()) if pool else None
+    if logbook is None:
+        logbook = gdrive.copy_file(TEMPLATE, logbook_name)
+
+        # Change permission of copied file
+        logbook.change_permission()
+    return logbook
+
+
+def _add_to_logbook_list(logbook_name, logbook_link):
+    """Add logbook name and link to the Logbook List Doc"""
+    newtxt = '%s %s\n{{new_logbook}}' % (logbook_name, logbook_link)
     gdrive.merge_template(LOGBOOK_LIST, {'{{next_experiment}}': newtxt})
-    print("finished!")
+
+
+def logbook_volumes(exppars):
+    """Return list of logbook volumes [{'name', 'id', 'link'}], including the current logbook"""
+    volumes = exppars.get('logbook_volumes', [])
+    if not volumes and exppars['logbook_id']:
+        volumes = [{'name': exppars['logbook_name'], 'id': exppars['logbook_id'], 'link': exppars['logbook_link']}]
+    return volumes
+
+
+def rollover_logbook(exppars):
+    """
+    Use Google Drive API to:
+        - Create a new volume of the logbook from the template
+        - Merge experimental parameters and share with the user emails
+        - Link the previous and new volumes
+        - update experimental parameters json file, so later appends go to the new volume
+        - Update Logbook list file with the new volume
+    Another process may start a new volume at the same time, so the experiment parameter file is
+    locked and read again first; if its logbook has changed, that volume is used instead.
+    :param exppars: dict experimental parameters or str filepath of experimental parameters json file
+    :return: exppars
+    """
+    if not isinstance(exppars, dict):
+        exppars = read_exppars(exppars)
+    with FileLock(exppars['experiment_parameters'] + '.lock'):
+        current = read_exppars(exppars['experiment_parameters'])
+        if current['logbook_id'] != exppars['logbook_id']:
+            print('New logbook volume already started: %s' % current['logbook_link'])
+            return current
+        exppars = current
+        volumes = logbook_volumes(exppars)
+        previous = volumes[-1]
+        name = '%s (vol %d)' % (exppars['logbook_name'], len(volumes) + 1)
+
+        logbook = _copy_template(name, get_template_pool())
+        volumes.append({'name': name, 'id': logbook.id, 'link': logbook.link})
+        exppars['logbook_volumes'] = volumes
+        exppars['logbook_id'] = logbook.id
+        exppars['logbook_link'] = logbook.link
+        exppars['replace_fields']['{{logbook_link}}'] = logbook.link
+        write_exppars(exppars)
+
+    logbook.merge(exppars['replace_fields'])
+    share_logbook(exppars)
+    logbook.new_entry().text('Continued from: ').text(previous['name'], link=previous['link']).end_paragraph().write()
+    gdrive.new_entry(previous['id']).text('Continued in: ').text(name, link=logbook.link).end_paragraph().write()
+    _add_to_logbook_list(name, logbook.link)
+    print('New logbook volume: %s\n%s' % (name, logbook.link))
+    return exppars
+
+
+def check_logbook_size(exppars):
+    """
+    Start a new logbook volume if the current logbook is too large
+    :param exppars: dict experimental parameters
+    :return: exppars, updated if a new volume was started
+    """
+    stats = gdrive.get_document_stats(exppars['logbook_id'])
+    if stats['end_index'] > LOGBOOK_MAX_LENGTH or stats['n_images'] > LOGBOOK_MAX_IMAGES:
+        print('Logbook is full: length=%d, images=%d' % (stats['end_index'], stats['n_images']))
+        exppars = rollover_logbook(exppars)
+    return exppars
+
+
+def _visit_files(exppars, include_images=True):
+    """Return list of FileIDs of every logbook volume and the image folder of a visit"""
+    file_ids = [volume['id'] for volume in logbook_volumes(exppars)]
+    if include_images and exppars.get('image_folder_id'):
+        file_ids.append(exppars['image_folder_id'])
+    return file_ids
+
+
+def share_logbook(exppars, role='writer', include_images=True):
+    """
+    Use Google Drive API to:
+        - give each user in exppars['user_emails'] permission to edit every logbook volume and the image folder
+    Notification emails are not sent.
+    :param exppars: dict experimental parameters or str filepath of experimental parameters json file
+    :param role: str 'reader', 'commenter' or 'writer'
+    :param include_images: bool, if True, also share the image folder
+    :return: bool, True if every permission was created
+    """
+    if not isinstance(exppars, dict):
+        exppars = read_exppars(exppars)
+    emails = list(exppars.get('user_emails', {}).values())
+    if not exppars['logbook_id'] or not emails:
+        print('Nothing to share')
+        return True
+    file_ids = _visit_files(exppars, include_images)
+    n_shared = gdrive.share(file_ids, emails, role)
+    if n_shared < len(file_ids) * len(emails):
+        print('WARNING: logbook is not shared with every user, run: logbook.py share %s' % (
+            exppars.get('experiment_parameters', '<exppars file>')))
+        return False
+    return True
+
+
+def unshare_logbook(exppars, include_images=True):
+    """
+    Use Google Drive API to:
+        - remove permissions of each user in exppars['user_emails'] from every logbook volume and the image folder
+    :param exppars: dict experimental parameters or str filepath of experimental parameters json file
+    :param include_images: bool, if True, also remove permissions from the image folder
+    :return: None
+    """
+    if not isinstance(exppars, dict):
+        exppars = read_exppars(exppars)
+    emails = list(exppars.get('user_emails', {}).values())
+    if not exppars['logbook_id'] or not emails:
+        print('Nothing to unshare')
+        return
+    gdrive.revoke(_visit_files(exppars, include_images), emails)
 
 
 def download_logbook(exp_pars_file='mm12345-1.json'):
     """
     Use Google Drive API to:
-        - download pdf of GoogleDoc logbook
+        - download pdf of GoogleDoc logbook, one pdf per logbook volume
     :param exp_pars_file: str filepath of experimental parameters json file
     :return: None
     """
@@ -95,8 +322,37 @@ def download_logbook(exp_pars_file='mm12345-1.json'):
         print("Logbook doesn't exists!")
         return
 
-    output_pdf = os.path.join(exppars['scriptdir'], exppars['logbook_name'] + '.pdf')
-    gdrive.download_pdf(exppars['logbook_id'], output_pdf)
+    for volume in logbook_volumes(exppars):
+        output_pdf = os.path.join(exppars['scriptdir'], volume['name'] + '.pdf')
+        gdrive.download_pdf(volume['id'], output_pdf)
+
+
+def archive_logbook(exp_pars_file='mm12345-1.json', formats=('pdf', 'docx', 'html', 'txt'), archive_type='.tar.gz',
+                    chunksize=DOWNLOAD_CHUNK_SIZE):
+    """
+    Use Google Drive API to:
+        - export all logbook volumes in several formats, with their images, to one archive
+    :param exp_pars_file: str filepath of experimental parameters json file
+    :param formats: list of export formats, from 'pdf', 'docx', 'html', 'txt'
+    :param archive_type: str archive extension, '.tar.gz' or '.zip'
+    :param chunksize: int bytes per download request
+    :return: str archive filename
+    :raises IOError: if any export or image failed, the archive is written without them
+    """
+    # Read merge fields JSON
+    exppars = read_exppars(exp_pars_file)
+
+    if not exppars['logbook_id']:
+        print("Logbook doesn't exists!")
+        return
+
+    archive_file = os.path.join(exppars['scriptdir'], exppars['logbook_name'] + '_archive' + archive_type)
+    doc_ids = [volume['id'] for volume in logbook_volumes(exppars)]
+    manifest = gdrive.archive(doc_ids, archive_file, formats, chunksize=chunksize)
+    if manifest['failures']:
+        raise IOError('Archive %s is incomplete, failed: %s' % (
+            archive_file, '; '.join(str(failure) for failure in manifest['failures'])))
+    return archive_file
 
 
 def append_text(exp_pars_file='mm12345-1.json', text_to_append=''):
@@ -114,13 +370,38 @@ def append_text(exp_pars_file='mm12345-1.json', text_to_append=''):
         print("Logbook doesn't exists!")
         return
 
+    exppars = check_logbook_size(exppars)
     gdrive.append_text(exppars['logbook_id'], text_to_append)
 
 
+def append_text_file(exp_pars_file='mm12345-1.json', text_file=''):
+    """
+    Use Google Drive API to:
+        - append the contents of a text file to the GoogleDoc logbook, in chunks
+        - large files are uploaded to Drive and linked
+    :param exp_pars_file: str filepath of experimental parameters json file
+    :param text_file: str filename of text file, e.g. a scan log or macro
+    :return: None
+    :raises FileNotFoundError: if text_file doesn't exist
+    """
+    if not os.path.isfile(text_file):
+        raise FileNotFoundError('Text file not found: %s' % text_file)
+
+    # Read merge fields JSON
+    exppars = read_exppars(exp_pars_file)
+
+    if not exppars['logbook_id']:
+        print("Logbook doesn't exists!")
+        return
+
+    exppars = check_logbook_size(exppars)
+    gdrive.append_text_stream(exppars['logbook_id'], text_file)
+
+
 def append_image(exp_pars_file='mm12345-1.json', image_loc=''):
     """
     Use Google Drive API to:
-        - download pdf of GoogleDoc logbook
+        - upload image to the visit image folder and append it to GoogleDoc logbook
     :param exp_pars_file: str filepath of experimental parameters json file
     :param image_loc: str filename of image to append
     :return: None
@@ -132,4 +413,77 @@ def append_image(exp_pars_file='mm12345-1.json', image_loc=''):
         print("Logbook doesn't exists!")
         return
 
-    gdrive.append_image(exppars['logbook_id'], image_loc)
\ No newline at end of file
+    exppars = check_logbook_size(exppars)
+    gdrive.append_image(exppars['logbook_id'], image_loc, image_folder(exppars))
+
+
+def bulk_merge_logbooks(exp_pars_files, merge_fields, max_workers=4):
+    """
+    Use Google Drive API to:
+        - replace {{fields}} in many logbooks concurrently, including all logbook volumes
+    :param exp_pars_files: list of str filepaths of experimental parameters json files
+    :param merge_fields: dict of fields to replace {'{{replace me}}': 'with me'}
+    :param max_workers: int maximum number of concurrent requests
+    :return: replacements, failures
+        replacements: dict {logbook_id: number of replacements}, logbooks with no replacements are not included
+        failures: list of dicts {'document': logbook_id, 'error': str} of logbooks that could not be merged
+    """
+    doc_ids = []
+    for exp_pars_file in exp_pars_files:
+        exppars = read_exppars(exp_pars_file)
+        doc_ids += [volume['id'] for volume in logbook_volumes(exppars)]
+    replacements, failures = gdrive.bulk_merge(doc_ids, merge_fields, max_workers)
+    for doc_id, occurrences in replacements.items():
+        print('%s: %d replacements' % (doc_id, occurrences))
+    return replacements, failures
+
+
+def sync_search_index(index_file=SEARCH_INDEX):
+    """
+    Use Google Drive API to:
+        - read the list of logbooks from the Logbook List Doc
+        - update the local search index with any logbooks that have changed
+    :param index_file: str filename of local search index
+    :return: None
+    """
+    logbook_list = gdrive.get_document_text(LOGBOOK_LIST)
+    doc_ids = find_document_ids(logbook_list['text'])
+    index = LogbookIndex(index_file)
+    index.sync(doc_ids, gdrive)
+    index.close()
+
+
+def search_logbooks(search, index_file=SEARCH_INDEX, limit=20, fts_syntax=False):
+    """
+    Search the local index of logbooks, no API calls are made
+    :param search: str search terms, e.g. 'mm12345-1', '12345.nxs'
+    :param index_file: str filename of local search index
+    :param limit: int maximum number of results
+    :param fts_syntax: bool, if True, search is an FTS5 query, e.g. 'eta AND chi'
+    :return: list of dicts with keys 'doc_id', 'name', 'link', 'snippet'
+    """
+    index = LogbookIndex(index_file)
+    results = index.query(search, limit, fts_syntax=fts_syntax)
+    index.close()
+    return results
+
+
+def live_image(exp_pars_file='mm12345-1.json', min_interval=10):
+    """
+    Use Google Drive API to:
+        - create a live image in the GoogleDoc logbook, updated in place during a scan
+    Usage:
+        live = live_image('mm12345-1.json')
+        live.update('scan_image.png')  # during scan, updates are limited to one per min_interval
+        live.finish('scan_image.png')  # final frame
+    :param exp_pars_file: str filepath of experimental parameters json file
+    :param min_interval: float minimum time in seconds between updates
+    :return: LiveImage
+    """
+    exppars = read_exppars(exp_pars_file)
+
+    if not exppars['logbook_id']:
+        print("Logbook doesn't exists!")
+        return
+
+    return gdrive.live_image(exppars['logbook_id'], min_interval, image_folder(exppars))
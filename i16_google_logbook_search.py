@@ -0,0 +1,36 @@
+"""
+I16 Google Drive Logbook search
+Search the text of all logbooks using a local index
+
+Requires:
+ - Google API credentials "i16_user_google_creds.json" (for --sync only)
+
+Usage:
+$ python i16_google_logbook_search.py --sync
+$ python i16_google_logbook_search.py 'polarisation analyser'
+
+By Dan Porter
+Beamline I16
+Diamond Light Source Lid
+
+14-Feb-2022
+"""
+
+import sys
+
+from i16_google_logbook_scripts import sync_search_index, search_logbooks
+
+if __name__ == '__main__':
+    # --- Command line usage ---
+    args = sys.argv[1:]
+    if '--sync' in args:
+        args.remove('--sync')
+        sync_search_index()
+    if args:
+        for result in search_logbooks(' '.join(args)):
+            print('%s\n  %s\n  %s\n' % (result['name'], result['link'], result['snippet']))
+    elif len(sys.argv) < 2:
+        print('You must enter a search term, for example:')
+        print(' python i16_google_logbook_search.py \'polarisation analyser\'')
+        print('Update the search index using:')
+        print(' python i16_google_logbook_search.py --sync')
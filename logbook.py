@@ -0,0 +1,256 @@
+"""
+I16 Google Drive Logbook command line
+Single entry point for the logbook scripts
+
+Modules are imported only by the subcommand that needs them, and sign-in to Google happens
+when the API is first used, so printing usage or searching the local index is fast.
+
+Usage:
+$ python logbook.py create /dls_sw/i16/scripts/2022/mm12345-1/mm12345-1.json
+$ python logbook.py append-text /dls_sw/i16/scripts/2022/mm12345-1/mm12345-1.json 'text to append'
+$ python logbook.py append-file /dls_sw/i16/scripts/2022/mm12345-1/mm12345-1.json 'scan_log.txt'
+$ python logbook.py append-image /dls_sw/i16/scripts/2022/mm12345-1/mm12345-1.json 'file.png'
+$ python logbook.py append-scan /dls_sw/i16/scripts/2022/mm12345-1/mm12345-1.json '12345.nxs' --fit
+$ python logbook.py download /dls_sw/i16/scripts/2022/mm12345-1/mm12345-1.json
+$ python logbook.py archive /dls_sw/i16/scripts/2022/mm12345-1/mm12345-1.json --format pdf --format docx
+$ python logbook.py share /dls_sw/i16/scripts/2022/mm12345-1/mm12345-1.json
+$ python logbook.py unshare /dls_sw/i16/scripts/2022/mm12345-1/mm12345-1.json
+$ python logbook.py merge mm12345-1.json mm12346-1.json --field '{{localcontact}}=Dan Porter'
+$ python logbook.py search 'polarisation analyser' --sync
+$ python logbook.py refill-pool
+$ python logbook.py prune-images /dls_sw/i16/scripts/2022/mm12345-1/mm12345-1.json --dry-run
+$ python logbook.py startup-time
+$ I16_LOGBOOK_TRACE=trace.jsonl.gz python logbook.py append-text mm12345-1.json 'beam lost'
+$ python logbook.py replay-trace trace.jsonl.gz --speed 10
+
+By Dan Porter
+Beamline I16
+Diamond Light Source Lid
+
+14-Feb-2022
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+STARTUP_BUDGET = 0.5  # seconds, maximum time to print usage
+HEAVY_MODULES = ('googleapiclient', 'google_auth_oauthlib', 'google.auth', 'httplib2', 'requests')
+
+
+def create(args):
+    from i16_google_logbook_scripts import create_new_logbook
+    create_new_logbook(args.exppars)
+
+
+def append_text(args):
+    from i16_google_logbook_scripts import append_text
+    append_text(args.exppars, args.text)
+
+
+def append_file(args):
+    from i16_google_logbook_scripts import append_text_file
+    try:
+        append_text_file(args.exppars, args.file)
+    except FileNotFoundError as e:
+        print('ERROR: %s' % e)
+        return 1
+
+
+def append_image(args):
+    from i16_google_logbook_scripts import append_image
+    append_image(args.exppars, args.image)
+
+
+def append_scan(args):
+    from i16_google_logbook_append_babelscan import append_scan
+    append_scan(args.exppars, args.scan, args.fit)
+
+
+def download(args):
+    from i16_google_logbook_scripts import download_logbook
+    download_logbook(args.exppars)
+
+
+def archive(args):
+    from i16_google_logbook_scripts import archive_logbook
+    try:
+        archive_logbook(args.exppars, args.format or ('pdf', 'docx', 'html', 'txt'), args.type,
+                        args.chunk_size * 1024 * 1024)
+    except IOError as e:
+        print('ERROR: %s' % e)
+        return 1
+
+
+def share(args):
+    from i16_google_logbook_scripts import share_logbook
+    return 0 if share_logbook(args.exppars, args.role, not args.no_images) else 1
+
+
+def unshare(args):
+    from i16_google_logbook_scripts import unshare_logbook
+    unshare_logbook(args.exppars, not args.no_images)
+
+
+def merge(args):
+    from i16_google_logbook_scripts import bulk_merge_logbooks
+    merge_fields = dict(args.field)
+    replacements, failures = bulk_merge_logbooks(args.exppars, merge_fields, args.workers)
+    if failures:
+        print('ERROR: %d logbooks could not be merged' % len(failures))
+        return 1
+
+
+def merge_field(value):
+    """argparse type for --field, return ('{{field}}', 'replacement') from '{{field}}=replacement'"""
+    field, equals, replacement = value.partition('=')
+    if not equals or not field:
+        raise argparse.ArgumentTypeError("%r should be '{{field}}=replacement'" % value)
+    return field, replacement
+
+
+def search(args):
+    from i16_google_logbook_scripts import sync_search_index, search_logbooks
+    if args.sync:
+        sync_search_index()
+    if args.terms:
+        for result in search_logbooks(' '.join(args.terms), limit=args.limit, fts_syntax=args.fts):
+            print('%s\n  %s\n  %s\n' % (result['name'], result['link'], result['snippet']))
+
+
+def refill_pool(args):
+    from i16_google_logbook_scripts import refill_template_pool
+    refill_template_pool()
+
+
+def replay_trace(args):
+    from google_drive_api.trace import replay_trace
+    replay_trace(args.trace, args.speed, args.workers)
+
+
+def prune_images(args):
+    from i16_google_logbook_scripts import prune_images
+    prune_images(args.exppars, args.min_age, args.dry_run)
+
+
+def startup_time(args=None, budget=STARTUP_BUDGET):
+    """
+    Check the time taken to print usage and that importing the scripts doesn't load the Google API
+    :param args: argparse Namespace (unused)
+    :param budget: float maximum time in seconds to print usage
+    :return: int 0 if within budget, 1 otherwise
+    """
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable, os.path.abspath(__file__), '--help'], stdout=subprocess.DEVNULL, check=True)
+    elapsed = time.perf_counter() - t0
+
+    check = 'import sys, i16_google_logbook_scripts; print(" ".join(m for m in %r if m in sys.modules))'
+    loaded = subprocess.run(
+        [sys.executable, '-c', check % (HEAVY_MODULES,)],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True
+    ).stdout.split()
+
+    print('Usage printed in %.3f s (budget %.3f s)' % (elapsed, budget))
+    print('Google API modules loaded on import: %s' % (', '.join(loaded) if loaded else 'None'))
+    return 0 if elapsed <= budget and not loaded else 1
+
+
+def parser():
+    """Return argparse.ArgumentParser for the logbook command"""
+    main_parser = argparse.ArgumentParser(prog='logbook', description='I16 Google Drive Logbooks')
+    subparsers = main_parser.add_subparsers(title='commands', dest='command')
+    exppars_help = 'experimental parameters json file, e.g. /dls_sw/i16/scripts/2022/mm12345-1/mm12345-1.json'
+
+    sub = subparsers.add_parser('create', help='create a new logbook from the template')
+    sub.add_argument('exppars', help=exppars_help)
+    sub.set_defaults(func=create)
+
+    sub = subparsers.add_parser('append-text', help='append text to the logbook')
+    sub.add_argument('exppars', help=exppars_help)
+    sub.add_argument('text', help='text to append')
+    sub.set_defaults(func=append_text)
+
+    sub = subparsers.add_parser('append-file', help='append the contents of a text file to the logbook')
+    sub.add_argument('exppars', help=exppars_help)
+    sub.add_argument('file', help='text file, e.g. scan log or macro')
+    sub.set_defaults(func=append_file)
+
+    sub = subparsers.add_parser('append-image', help='append an image to the logbook')
+    sub.add_argument('exppars', help=exppars_help)
+    sub.add_argument('image', help='image filename or http link')
+    sub.set_defaults(func=append_image)
+
+    sub = subparsers.add_parser('append-scan', help='plot a scan with babelscan and append it to the logbook')
+    sub.add_argument('exppars', help=exppars_help)
+    sub.add_argument('scan', help='scan number or nexus file')
+    sub.add_argument('--fit', action='store_true', help='fit the default axes')
+    sub.set_defaults(func=append_scan)
+
+    sub = subparsers.add_parser('download', help='download the logbook to pdf in the scripts folder')
+    sub.add_argument('exppars', help=exppars_help)
+    sub.set_defaults(func=download)
+
+    sub = subparsers.add_parser('archive', help='export the logbook and its images to an archive in the scripts folder')
+    sub.add_argument('exppars', help=exppars_help)
+    sub.add_argument('--format', action='append', choices=['pdf', 'docx', 'html', 'txt'], help='default: all formats')
+    sub.add_argument('--type', default='.tar.gz', choices=['.tar.gz', '.zip'], help='archive type')
+    sub.add_argument('--chunk-size', type=int, default=10, help='MB per download request')
+    sub.set_defaults(func=archive)
+
+    sub = subparsers.add_parser('share', help='share the logbook with the user emails')
+    sub.add_argument('exppars', help=exppars_help)
+    sub.add_argument('--role', default='writer', choices=['reader', 'commenter', 'writer'])
+    sub.add_argument('--no-images', action='store_true', help="don't share the image folder")
+    sub.set_defaults(func=share)
+
+    sub = subparsers.add_parser('unshare', help='remove the user emails from the logbook')
+    sub.add_argument('exppars', help=exppars_help)
+    sub.add_argument('--no-images', action='store_true', help="don't unshare the image folder")
+    sub.set_defaults(func=unshare)
+
+    sub = subparsers.add_parser('merge', help='replace {{fields}} in many logbooks')
+    sub.add_argument('exppars', nargs='+', help=exppars_help)
+    sub.add_argument('--field', action='append', required=True, type=merge_field, help="replacement, e.g. '{{localcontact}}=Dan Porter'")
+    sub.add_argument('--workers', type=int, default=4, help='maximum number of concurrent requests')
+    sub.set_defaults(func=merge)
+
+    sub = subparsers.add_parser('search', help='search logbooks using the local index')
+    sub.add_argument('terms', nargs='*', help='search terms')
+    sub.add_argument('--sync', action='store_true', help='update the index from the Logbook List first')
+    sub.add_argument('--limit', type=int, default=20, help='maximum number of results')
+    sub.add_argument('--fts', action='store_true', help="terms are an SQLite FTS5 query, e.g. 'eta AND chi'")
+    sub.set_defaults(func=search)
+
+    sub = subparsers.add_parser('refill-pool', help='fill the pool of pre-copied templates')
+    sub.set_defaults(func=refill_pool)
+
+    sub = subparsers.add_parser('prune-images', help='trash images in the visit image folder not used by the logbook')
+    sub.add_argument('exppars', help=exppars_help)
+    sub.add_argument('--min-age', type=float, default=3600, help='keep images uploaded in the last MIN_AGE seconds')
+    sub.add_argument('--dry-run', action='store_true', help='list unused images without trashing them')
+    sub.set_defaults(func=prune_images)
+
+    sub = subparsers.add_parser('replay-trace', help='replay a recorded API trace against a stub transport')
+    sub.add_argument('trace', help='trace file, recorded with I16_LOGBOOK_TRACE=trace.jsonl.gz')
+    sub.add_argument('--speed', type=float, default=1.0, help='timescale, e.g. 10 to replay 10x faster')
+    sub.add_argument('--workers', type=int, default=10, help='maximum number of concurrent requests')
+    sub.set_defaults(func=replay_trace)
+
+    sub = subparsers.add_parser('startup-time', help='check the command starts within the time budget')
+    sub.set_defaults(func=startup_time)
+    return main_parser
+
+
+def main(argv=None):
+    main_parser = parser()
+    args = main_parser.parse_args(argv)
+    if args.command is None:
+        main_parser.print_help()
+        return 0
+    return args.func(args) or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
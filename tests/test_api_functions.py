@@ -0,0 +1,30 @@
+"""
+Tests of api_functions that don't need Google credentials
+"""
+
+import google_drive_api.api_functions as api
+
+
+def test_batch_execute_per_file_rounds(monkeypatch):
+    batches = []
+
+    def batch_execute(requests, service, batch_size=100):
+        batches.append(list(requests))
+        return [('response %s' % request, None) for request in requests]
+
+    monkeypatch.setattr(api, 'batch_execute', batch_execute)
+    file_requests = [('a', 'a1'), ('b', 'b1'), ('a', 'a2'), ('c', 'c1'), ('a', 'a3'), ('b', 'b2')]
+    results = api.batch_execute_per_file(file_requests, service=None)
+    # one request per file in each batch, in order
+    assert batches == [['a1', 'b1', 'c1'], ['a2', 'b2'], ['a3']]
+    # results in the order of the requests
+    assert results == [('response %s' % request, None) for _, request in file_requests]
+
+
+def test_utf16_len():
+    assert api.utf16_len('abc') == 3
+    assert api.utf16_len('a\U0001F600') == 3
+
+
+def test_escape_query():
+    assert api.escape_query("Dan's logbook \\") == "Dan\\'s logbook \\\\"
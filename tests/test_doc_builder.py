@@ -0,0 +1,77 @@
+"""
+Tests of the batchUpdate requests built by DocumentBuilder, no API calls are made
+"""
+
+import pytest
+
+from google_drive_api.doc_builder import DocumentBuilder
+
+
+def paragraph_style(start, end, named_style):
+    return {'updateParagraphStyle': {
+        'range': {'startIndex': start, 'endIndex': end},
+        'paragraphStyle': {'namedStyleType': named_style},
+        'fields': 'namedStyleType',
+    }}
+
+
+def bold(start, end):
+    return {'updateTextStyle': {'range': {'startIndex': start, 'endIndex': end},
+                                'textStyle': {'bold': True}, 'fields': 'bold'}}
+
+
+def test_text_indices_are_utf16():
+    entry = DocumentBuilder('doc_id').heading('Scan', 2).text('a\U0001F600', bold=True).end_paragraph()
+    assert entry.build_requests(10) == [
+        {'insertText': {'location': {'index': 10}, 'text': 'Scan\na\U0001F600\n'}},
+        paragraph_style(10, 15, 'HEADING_2'),
+        paragraph_style(15, 19, 'NORMAL_TEXT'),
+        bold(15, 18),  # the emoji is two UTF-16 code units
+    ]
+
+
+def test_new_paragraph_shifts_entry():
+    entry = DocumentBuilder('doc_id').heading('Scan', 2).text('a\U0001F600', bold=True).end_paragraph()
+    assert entry.build_requests(10, new_paragraph=True) == [
+        {'insertText': {'location': {'index': 10}, 'text': '\nScan\na\U0001F600\n'}},
+        paragraph_style(11, 16, 'HEADING_2'),
+        paragraph_style(16, 20, 'NORMAL_TEXT'),
+        bold(16, 19),
+    ]
+
+
+def test_image_splits_text():
+    entry = DocumentBuilder('doc_id').text('ab').image('https://example.com/image.png').text('c')
+    assert entry.build_requests(1) == [
+        {'insertText': {'location': {'index': 1}, 'text': 'ab'}},
+        {'insertInlineImage': {'location': {'index': 3}, 'uri': 'https://example.com/image.png'}},
+        {'insertText': {'location': {'index': 4}, 'text': '\nc\n'}},
+        paragraph_style(1, 7, 'NORMAL_TEXT'),
+    ]
+
+
+def test_table_cells_filled_from_end():
+    entry = DocumentBuilder('doc_id').table([['h1', 'h2'], ['x']])
+    assert entry.build_requests(1) == [
+        {'insertTable': {'location': {'index': 1}, 'rows': 2, 'columns': 2}},
+        {'insertText': {'location': {'index': 10}, 'text': 'x'}},
+        {'insertText': {'location': {'index': 7}, 'text': 'h2'}},
+        {'insertText': {'location': {'index': 5}, 'text': 'h1'}},
+        {'insertText': {'location': {'index': 18}, 'text': '\n'}},
+        paragraph_style(1, 2, 'NORMAL_TEXT'),
+        paragraph_style(18, 19, 'NORMAL_TEXT'),
+        bold(5, 7),  # header cells, at their index once every cell is filled
+        bold(9, 11),
+    ]
+
+
+@pytest.mark.parametrize('rows', [[], [[]], [[], []]])
+def test_empty_table(rows):
+    with pytest.raises(ValueError):
+        DocumentBuilder('doc_id').table(rows)
+
+
+@pytest.mark.parametrize('level', [-1, 7, 1.5])
+def test_heading_level(level):
+    with pytest.raises(ValueError):
+        DocumentBuilder('doc_id').heading('Scan', level)
@@ -0,0 +1,15 @@
+"""
+Tests of the logbook command line
+"""
+
+import logbook
+
+
+def test_startup_time():
+    # usage is printed within the budget, without loading the Google API
+    assert logbook.startup_time() == 0
+
+
+def test_merge_field():
+    assert logbook.merge_field('{{localcontact}}=Dan Porter') == ('{{localcontact}}', 'Dan Porter')
+    assert logbook.merge_field('{{equation}}=a=b') == ('{{equation}}', 'a=b')
@@ -0,0 +1,49 @@
+"""
+Tests of the operation scheduler
+"""
+
+import threading
+from concurrent.futures import Future
+
+from google_drive_api.scheduler import OperationScheduler, INTERACTIVE, IMAGES, BULK
+
+
+def test_same_key_runs_in_order():
+    scheduler = OperationScheduler()
+    order = []
+    release = threading.Event()
+    first = scheduler.submit(release.wait, 5, key='doc_id')
+    futures = [
+        scheduler.submit(order.append, n, lane=lane, key='doc_id')
+        for n, lane in enumerate([INTERACTIVE, BULK, INTERACTIVE, IMAGES, INTERACTIVE])
+    ]
+    assert order == []  # all waiting for the first operation
+    release.set()
+    for future in [first] + futures:
+        future.result(5)
+    assert order == [0, 1, 2, 3, 4]
+    scheduler.shutdown()
+
+
+def test_other_keys_not_blocked():
+    scheduler = OperationScheduler()
+    release = threading.Event()
+    blocked = scheduler.submit(release.wait, 5, key='doc1')
+    assert scheduler.submit(str, 'done', key='doc2').result(5) == 'done'
+    release.set()
+    blocked.result(5)
+    scheduler.shutdown()
+
+
+def test_after_queues_when_done():
+    scheduler = OperationScheduler()
+    order = []
+    upload = Future()
+    image = scheduler.submit(order.append, 'image', key='doc_id', after=upload)
+    scheduler.submit(order.append, 'text', key='doc_id').result(5)
+    assert order == ['text']  # the image doesn't hold up the text
+    upload.set_result('link')
+    image.result(5)
+    assert order == ['text', 'image']
+    assert scheduler.queue_depth() == 0
+    scheduler.shutdown()
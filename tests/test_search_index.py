@@ -0,0 +1,33 @@
+"""
+Tests of the local search index, using a temporary SQLite file
+"""
+
+from google_drive_api.search_index import LogbookIndex, fts_query, find_document_ids
+
+
+def test_fts_query_quotes_terms():
+    assert fts_query('mm12345-1 12345.nxs') == '"mm12345-1" "12345.nxs"'
+
+
+def test_fts_query_escapes_quotes():
+    assert fts_query('say "hi"  there') == '"say" """hi""" "there"'
+
+
+def test_fts_query_empty():
+    assert fts_query('   ') == ''
+
+
+def test_find_document_ids():
+    text = ('mm1 https://docs.google.com/document/d/1fF1CU3UJq_qlqn43D9AWLovTr1sLK8HuOK9AIWk_HRI/edit\n'
+            'again https://docs.google.com/document/d/1fF1CU3UJq_qlqn43D9AWLovTr1sLK8HuOK9AIWk_HRI/edit')
+    assert find_document_ids(text) == ['1fF1CU3UJq_qlqn43D9AWLovTr1sLK8HuOK9AIWk_HRI']
+
+
+def test_query_punctuated_terms(tmp_path):
+    index = LogbookIndex(str(tmp_path / 'index.db'))
+    index.add_document('doc1', 'mm12345-1 Logbook', 'link1', 'scan 12345.nxs eta scan, beam lost')
+    index.add_document('doc2', 'mm12346-1 Logbook', 'link2', 'scan 12346.nxs chi scan')
+    assert [result['doc_id'] for result in index.query('12345.nxs')] == ['doc1']
+    assert [result['doc_id'] for result in index.query('mm12346-1')] == ['doc2']
+    assert sorted(result['doc_id'] for result in index.query('eta OR chi', fts_syntax=True)) == ['doc1', 'doc2']
+    index.close()
@@ -0,0 +1,28 @@
+"""
+Tests of trace redaction
+"""
+
+from google_drive_api.trace import redact, redact_uri
+
+DOC_ID = '1fF1CU3UJq_qlqn43D9AWLovTr1sLK8HuOK9AIWk_HRI'
+
+
+def test_redact_keeps_structure():
+    value = {'text': 'beam lost', 'index': 12, 'ids': ['ab']}
+    assert redact(value) == {'text': 'xxxxxxxxx', 'index': 12, 'ids': ['xx']}
+
+
+def test_redact_uri_file_id():
+    uri = 'https://www.googleapis.com/drive/v3/files/%s?fields=id&alt=json' % DOC_ID
+    assert redact_uri(uri) == 'https://www.googleapis.com/drive/v3/files/%s?fields=id&alt=json' % ('x' * len(DOC_ID))
+
+
+def test_redact_uri_method_suffix():
+    uri = 'https://docs.googleapis.com/v1/documents/%s:batchUpdate?alt=json' % DOC_ID
+    assert redact_uri(uri) == 'https://docs.googleapis.com/v1/documents/%s:batchUpdate?alt=json' % ('x' * len(DOC_ID))
+
+
+def test_redact_uri_query_values():
+    uri = "https://www.googleapis.com/drive/v3/files?q=name+%3D+%27mm12345-1%27&pageSize=100"
+    query = 'x' * len("name = 'mm12345-1'")
+    assert redact_uri(uri) == 'https://www.googleapis.com/drive/v3/files?q=%s&pageSize=100' % query